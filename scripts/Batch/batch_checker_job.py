@@ -8,20 +8,30 @@ Batch Checker Job: Cloud Scheduler から定期実行される軽量ジョブ
 3. 完了したプロジェクトがあれば Post-flow Job を起動
 
 【Cloud Scheduler 設定】
-- 頻度: */5 * * * * (5分ごと)
+- 頻度: 0 * * * * (1時間ごと)
 - ターゲット: Cloud Run Job
+
+※ 完了検知は batch_webhook_server.py (OpenAI Webhook) が正常系。
+  このジョブは Webhook を取りこぼした場合のフォールバック
 """
 import os
 import sys
-import json
+import copy
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
 
 # 親ディレクトリをパスに追加
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from openai import OpenAI
-from google.cloud import storage
+from google.api_core.exceptions import NotFound, NotModified, PreconditionFailed
+from config import BATCH_STATUS_SAVE_MAX_ATTEMPTS
+from json_utils import json_dumps_bytes, json_loads
+from gcs_utils import get_gcs_client
+from batch_status_api import check_pending_batches
 
 load_dotenv()
 
@@ -31,76 +41,215 @@ BATCH_STATUS_BLOB = "batch_status.json"
 PROJECT_ID = os.environ.get("GCP_PROJECT_ID", "")
 REGION = os.environ.get("GCP_REGION", "asia-northeast1")
 POST_FLOW_JOB_NAME = "batch-post-flow-job"
+POST_FLOW_TRIGGER_WORKERS = 8  # Post-flow Job 起動の同時実行数
+
+# クライアントはプロセス内で使い回す（接続プールを再利用）
+_run_client = None
+_run_client_lock = threading.Lock()
+
+# 最後に読み書きした batch_status.json のハッシュ（変更なしならアップロードをスキップ）
+_last_state_sha = None
+# 最後に読み書きした projects のスナップショット（競合時のマージで自分の変更を判定）
+_loaded_projects = {}
+# 最後に読み書きした batch_status.json の本体（GCS の generation が変わらなければ再ダウンロードしない）
+# Cloud Run Job は毎回新しいコンテナで起動するため、効果があるのは常駐する Webhook サーバーのみ
+_status_cache = None
+
+
+def _get_run_client():
+    """
+    Cloud Run Jobs クライアントを取得（初回のみ生成、スレッドセーフ）
+    """
+    global _run_client
+    with _run_client_lock:
+        if _run_client is None:
+            from google.cloud import run_v2
+            _run_client = run_v2.JobsClient()
+    return _run_client
+
+
+def _write_status_cache(generation, content):
+    """読み書きした本体を generation とともにプロセス内に保持"""
+    global _status_cache
+    _status_cache = {"generation": generation, "content": content}
+
+
+def _serialize_batch_status(status_data):
+    """バッチ状態を保存形式（UTF-8 bytes）に変換"""
+    return json_dumps_bytes(status_data, indent=True)
+
+
+def _state_digest(content):
+    """保存内容のハッシュを計算"""
+    return hashlib.blake2b(content).hexdigest()
+
+
+def _remember_loaded_state(status_data):
+    """読み込んだ（保存した）状態のハッシュとスナップショットを記録し、そのまま返す"""
+    global _last_state_sha, _loaded_projects
+    _last_state_sha = _state_digest(_serialize_batch_status(status_data))
+    _loaded_projects = copy.deepcopy(status_data.get("projects", {}))
+    return status_data
+
+
+def _download_batch_status(blob, if_generation_not_match=None):
+    """
+    batch_status.json 本体をダウンロード
+    
+    Args:
+        if_generation_not_match: 指定した generation と一致する場合は NotModified を送出
+    
+    Returns:
+        tuple: (status_data, generation)。存在しない場合は generation=0
+    """
+    try:
+        content = blob.download_as_bytes(if_generation_not_match=if_generation_not_match)
+    except NotFound:
+        return {"projects": {}}, 0
+    
+    _write_status_cache(blob.generation, content)
+    return json_loads(content), blob.generation
+
+
+def _merge_remote_changes(status_data, remote_data):
+    """
+    他のジョブが先に保存した内容に、このジョブでの変更を重ねる（status_data を直接更新）
+    
+    - このジョブで変更したプロジェクト: batch_id が同じならこちらを優先
+      （ただし他のジョブが既に post_flow_started にしていればそちらを優先）
+    - それ以外: リモートの内容を採用（追加・削除も反映）
+    """
+    local_projects = status_data.setdefault("projects", {})
+    remote_projects = remote_data.get("projects", {})
+    
+    for project_name in list(local_projects):
+        local_info = local_projects[project_name]
+        remote_info = remote_projects.get(project_name)
+        
+        changed_here = _loaded_projects.get(project_name) != local_info
+        if (changed_here and remote_info is not None
+                and remote_info.get("batch_id") == local_info.get("batch_id")
+                and remote_info.get("status") != "post_flow_started"):
+            continue
+        
+        if remote_info is None:
+            del local_projects[project_name]
+        else:
+            local_projects[project_name] = remote_info
+    
+    for project_name, remote_info in remote_projects.items():
+        local_projects.setdefault(project_name, remote_info)
 
 
 def load_batch_status_from_gcs():
     """
     Cloud Storage から batch_status.json を読み込み
+    
+    プロセス内キャッシュの generation を条件付き GET で渡し、1リクエストで
+    「変更なし（キャッシュを使用）/ 最新の本体 / 存在しない」を判定する
+    
+    Returns:
+        tuple: (status_data, generation)
+            generation は保存時の競合検出に使う（存在しない場合は 0、読み込み失敗時は None）
     """
     if not GCS_BUCKET:
         print("⚠️ GCS_BUCKET_NAME が設定されていません")
-        return {"projects": {}}
+        return {"projects": {}}, None
     
     try:
-        client = storage.Client()
+        client = get_gcs_client()
         bucket = client.bucket(GCS_BUCKET)
         blob = bucket.blob(BATCH_STATUS_BLOB)
         
-        if not blob.exists():
-            print("📁 batch_status.json が存在しません")
-            return {"projects": {}}
+        cache = _status_cache
+        cached_generation = cache.get("generation") if cache else None
+        
+        try:
+            status_data, generation = _download_batch_status(blob, if_generation_not_match=cached_generation)
+        except NotModified:
+            print(f"📦 batch_status.json をキャッシュから読み込みました (generation: {cached_generation})")
+            return _remember_loaded_state(json_loads(cache["content"])), cached_generation
         
-        content = blob.download_as_text()
-        return json.loads(content)
+        if generation == 0:
+            print("📁 batch_status.json が存在しません")
+        return _remember_loaded_state(status_data), generation
     
     except Exception as e:
         print(f"⚠️ GCS 読み込みエラー: {e}")
-        return {"projects": {}}
+        return {"projects": {}}, None
+
 
+def is_batch_status_saved(status_data):
+    """status_data が最後に読み書きした GCS の内容と一致しているか（保存に失敗していないか）"""
+    return _state_digest(_serialize_batch_status(status_data)) == _last_state_sha
 
-def save_batch_status_to_gcs(status_data):
+
+def save_batch_status_to_gcs(status_data, generation):
     """
-    Cloud Storage に batch_status.json を保存
+    Cloud Storage に batch_status.json を保存（前回から変更がなければスキップ）
+    
+    読み込み時の generation を条件に保存し、他のジョブが先に更新していた場合は
+    読み直して自分の変更をマージしてから再保存する（最大 BATCH_STATUS_SAVE_MAX_ATTEMPTS 回）
+    
+    Args:
+        status_data: 保存する状態（競合時はマージ結果で直接更新される）
+        generation: 読み込み時の generation
+    
+    Returns:
+        int: 保存後の generation（次回保存時に渡す）
     """
     if not GCS_BUCKET:
-        return
+        return generation
     
     try:
-        client = storage.Client()
+        client = get_gcs_client()
         bucket = client.bucket(GCS_BUCKET)
-        blob = bucket.blob(BATCH_STATUS_BLOB)
         
-        blob.upload_from_string(
-            json.dumps(status_data, ensure_ascii=False, indent=2),
-            content_type="application/json"
-        )
-        print(f"✅ batch_status.json を GCS に保存しました")
+        for attempt in range(1, BATCH_STATUS_SAVE_MAX_ATTEMPTS + 1):
+            content = _serialize_batch_status(status_data)
+            if _state_digest(content) == _last_state_sha:
+                print("⏭️ batch_status.json に変更がないため保存をスキップしました")
+                return generation
+            
+            # Blob は読み書きした generation に固定されるため、試行ごとに作り直す
+            blob = bucket.blob(BATCH_STATUS_BLOB)
+            try:
+                blob.upload_from_string(
+                    content,
+                    content_type="application/json",
+                    if_generation_match=generation
+                )
+            except PreconditionFailed:
+                print(f"⚠️ batch_status.json が他のジョブに更新されていました。再読み込みしてマージします ({attempt}/{BATCH_STATUS_SAVE_MAX_ATTEMPTS})")
+                remote_data, generation = _download_batch_status(bucket.blob(BATCH_STATUS_BLOB))
+                _merge_remote_changes(status_data, remote_data)
+                _remember_loaded_state(remote_data)
+                continue
+            
+            generation = blob.generation
+            _write_status_cache(generation, content)
+            _remember_loaded_state(status_data)
+            print(f"✅ batch_status.json を GCS に保存しました")
+            return generation
+        
+        print(f"❌ batch_status.json の保存を断念しました（競合が {BATCH_STATUS_SAVE_MAX_ATTEMPTS} 回続きました）")
+        return generation
     
     except Exception as e:
         print(f"⚠️ GCS 保存エラー: {e}")
+        return generation
 
 
-def check_batch_status_api(batch_id):
+def print_batch_progress(batch):
     """
-    OpenAI API でバッチステータスを確認
+    バッチの進捗情報を表示
     """
-    try:
-        client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-        batch = client.batches.retrieve(batch_id)
-        
-        # 進捗情報
-        if hasattr(batch, 'request_counts'):
-            counts = batch.request_counts
-            completed = getattr(counts, 'completed', 0)
-            failed = getattr(counts, 'failed', 0)
-            total = getattr(counts, 'total', 0)
-            print(f"  進捗: {completed}/{total} 完了, {failed} 失敗")
-        
-        return batch.status, batch
-    
-    except Exception as e:
-        print(f"⚠️ API エラー: {e}")
-        return "error", None
+    if hasattr(batch, 'request_counts'):
+        counts = batch.request_counts
+        completed = getattr(counts, 'completed', 0)
+        failed = getattr(counts, 'failed', 0)
+        total = getattr(counts, 'total', 0)
+        print(f"  進捗: {completed}/{total} 完了, {failed} 失敗")
 
 
 def trigger_post_flow_job(project_name, project_info):
@@ -110,7 +259,7 @@ def trigger_post_flow_job(project_name, project_info):
     try:
         from google.cloud import run_v2
         
-        client = run_v2.JobsClient()
+        client = _get_run_client()
         
         # Job 名
         job_name = f"projects/{PROJECT_ID}/locations/{REGION}/jobs/{POST_FLOW_JOB_NAME}"
@@ -134,7 +283,7 @@ def trigger_post_flow_job(project_name, project_info):
         
         operation = client.run_job(request=request)
         print(f"✅ Post-flow Job を起動しました: {project_name}")
-        print(f"   Operation: {operation.operation.name}")
+        print(f"   Operation ({project_name}): {operation.operation.name}")
         
         return True
     
@@ -156,7 +305,7 @@ def main():
         sys.exit(1)
     
     # batch_status.json を読み込み
-    status_data = load_batch_status_from_gcs()
+    status_data, generation = load_batch_status_from_gcs()
     projects = status_data.get("projects", {})
     
     if not projects:
@@ -168,23 +317,31 @@ def main():
     
     completed_projects = []
     
-    for project_name, project_info in projects.items():
-        batch_id = project_info["batch_id"]
-        current_status = project_info.get("status", "unknown")
-        
-        # 既に完了/失敗しているものはスキップ
-        if current_status in ["completed", "failed", "expired", "cancelled", "post_flow_started"]:
-            continue
-        
+    # 既に完了/失敗しているものはスキップ
+    pending_projects = [
+        (project_name, project_info)
+        for project_name, project_info in projects.items()
+        if project_info.get("status", "unknown") not in ["completed", "failed", "expired", "cancelled", "post_flow_started"]
+    ]
+    
+    # API でステータス確認（並列）
+    results = asyncio.run(check_pending_batches(
+        [project_info["batch_id"] for _, project_info in pending_projects],
+        print
+    ))
+    
+    checked_at = datetime.now().isoformat()
+    
+    for (project_name, project_info), (api_status, batch_obj) in zip(pending_projects, results):
         print(f"\n📋 {project_name}")
-        print(f"   Batch ID: {batch_id}")
+        print(f"   Batch ID: {project_info['batch_id']}")
         
-        # API でステータス確認
-        api_status, batch_obj = check_batch_status_api(batch_id)
+        if batch_obj is not None:
+            print_batch_progress(batch_obj)
         
         # 状態を更新
         project_info["status"] = api_status
-        project_info["last_checked"] = datetime.now().isoformat()
+        project_info["last_checked"] = checked_at
         
         if api_status == "completed":
             print(f"✅ バッチ完了: {project_name}")
@@ -196,21 +353,36 @@ def main():
         else:
             print(f"   ステータス: {api_status}")
     
-    # 状態を保存
-    save_batch_status_to_gcs(status_data)
+    # 状態を保存（読み込み時から変更がなければスキップされる）
+    generation = save_batch_status_to_gcs(status_data, generation)
+    
+    # 完了したプロジェクトの Post-flow Job を起動（並列）
+    # 保存できた場合のみ起動し、マージで他のジョブが既に起動済み/削除済みにしたものは除く
+    if is_batch_status_saved(status_data):
+        projects_to_trigger = [
+            project_name for project_name in completed_projects
+            if projects.get(project_name, {}).get("status") == "completed"
+        ]
+    else:
+        print("⚠️ batch_status.json を保存できなかったため、Post-flow Job の起動は次回に回します")
+        projects_to_trigger = []
     
-    # 完了したプロジェクトの Post-flow Job を起動
-    for project_name in completed_projects:
-        project_info = projects[project_name]
+    if projects_to_trigger:
+        with ThreadPoolExecutor(max_workers=min(POST_FLOW_TRIGGER_WORKERS, len(projects_to_trigger))) as executor:
+            triggered = list(executor.map(
+                lambda project_name: trigger_post_flow_job(project_name, projects[project_name]),
+                projects_to_trigger
+            ))
         
-        if trigger_post_flow_job(project_name, project_info):
-            # 状態を更新（重複起動防止）
-            project_info["status"] = "post_flow_started"
-            project_info["post_flow_started_at"] = datetime.now().isoformat()
+        for project_name, success in zip(projects_to_trigger, triggered):
+            if success:
+                # 状態を更新（重複起動防止）
+                project_info = projects[project_name]
+                project_info["status"] = "post_flow_started"
+                project_info["post_flow_started_at"] = datetime.now().isoformat()
     
-    # 最終状態を保存
-    if completed_projects:
-        save_batch_status_to_gcs(status_data)
+    # 最終状態を保存（起動しなかった場合は変更がないためスキップされる）
+    save_batch_status_to_gcs(status_data, generation)
     
     print(f"\n{'='*60}")
     print(f"✅ Checker Job 完了")
@@ -15,8 +15,15 @@ Batch Crawler: バッチ処理監視デーモン
 """
 import os
 import sys
-import json
 import time
+import math
+import hashlib
+import locale
+import random
+import asyncio
+import importlib
+import threading
+import traceback
 import subprocess
 from datetime import datetime
 from dotenv import load_dotenv
@@ -24,9 +31,13 @@ from dotenv import load_dotenv
 # 親ディレクトリをパスに追加
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from openai import OpenAI
-from config import BATCH_CHECK_INTERVAL, LOGS_DIR, PROJECT_ROOT
+from config import (
+    BATCH_CHECK_INTERVAL, LOGS_DIR, PROJECT_ROOT,
+    BATCH_POLL_BASE_INTERVAL, BATCH_POLL_MAX_INTERVAL, BATCH_POLL_JITTER, BATCH_POLL_AGE_FACTOR
+)
 from logger_utils import DualLogger
+from batch_status_api import check_pending_batches
+from json_utils import json_dumps_bytes, json_loads, write_bytes_atomic, write_json_atomic
 
 load_dotenv()
 
@@ -40,6 +51,19 @@ P2_BATCH_RETRIEVE_SCRIPT = os.path.join(BASE_DIR, "Batch", "p2_gpt_batch_retriev
 P2_5_VIDEO_SCRIPT = os.path.join(BASE_DIR, "p2_5_hailuo_generate_videos.py")
 P3_UPLOAD_SCRIPT = os.path.join(BASE_DIR, "p3_gdrive_upload.py")
 
+# サブプロセス実行のタイムアウト（秒）
+PHASE_SCRIPT_TIMEOUT = 86400  # 24時間
+
+# サブプロセスの出力のエンコーディング（起動時に1回だけ取得）
+SYSTEM_ENCODING = locale.getpreferredencoding() or 'utf-8'
+
+# 後続フェーズは既定ではサブプロセスで実行する（24時間のタイムアウトで kill でき、モジュールの状態も持ち越さない）
+# BATCH_PHASE_IN_PROCESS=1 の場合のみプロセス内で main() を呼び出す（タイムアウトは効かない）
+USE_IN_PROCESS_PHASES = os.environ.get("BATCH_PHASE_IN_PROCESS") == "1"
+
+# 最後に読み書きした batch_status.json のハッシュ（変更なしなら書き込みをスキップ）
+_last_state_sha = None
+
 
 def load_batch_status():
     """
@@ -53,23 +77,50 @@ def load_batch_status():
                     "batch_type": "gpt_images",  # or "claude_prompts"
                     "status": "in_progress",  # validating, in_progress, completed, failed
                     "submitted_at": "2024-01-01T00:00:00",
+                    "submitted_at_ts": 1704034800.0,  # submitted_at のエポック秒（ループ内でのパース回避）
                     "last_checked": "2024-01-01T00:00:00",
+                    "next_check_at": "2024-01-01T00:00:30",  # 次回ポーリング予定時刻
+                    "next_check_at_ts": 1704034830.0,  # next_check_at のエポック秒
+                    "poll_count": 0,  # 未完了で確認した回数
                     "output_dir": "/path/to/output",
                     "model_name": "claude"
                 }
             }
         }
     """
+    global _last_state_sha
+    
     if os.path.exists(BATCH_STATUS_FILE):
-        with open(BATCH_STATUS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(BATCH_STATUS_FILE, "rb") as f:
+            status_data = json_loads(f.read())
+        _last_state_sha = _state_digest(_serialize_batch_status(status_data))
+        return status_data
+    
+    _last_state_sha = None
     return {"projects": {}}
 
 
+def _serialize_batch_status(status_data):
+    """バッチ状態を保存形式（UTF-8 bytes）に変換"""
+    return json_dumps_bytes(status_data, indent=True)
+
+
+def _state_digest(content):
+    """保存内容のハッシュを計算"""
+    return hashlib.blake2b(content).hexdigest()
+
+
 def save_batch_status(status_data):
-    """バッチ状態ファイルを保存"""
-    with open(BATCH_STATUS_FILE, "w", encoding="utf-8") as f:
-        json.dump(status_data, f, ensure_ascii=False, indent=2)
+    """バッチ状態ファイルを保存（前回から変更がなければスキップ）"""
+    global _last_state_sha
+    
+    content = _serialize_batch_status(status_data)
+    sha = _state_digest(content)
+    if sha == _last_state_sha:
+        return
+    
+    write_bytes_atomic(BATCH_STATUS_FILE, content)
+    _last_state_sha = sha
 
 
 def register_batch(project_name, batch_id, batch_type, output_dir, model_name="claude"):
@@ -84,13 +135,18 @@ def register_batch(project_name, batch_id, batch_type, output_dir, model_name="c
         model_name: モデル名
     """
     status_data = load_batch_status()
+    submitted_at = time.time()
     
     status_data["projects"][project_name] = {
         "batch_id": batch_id,
         "batch_type": batch_type,
         "status": "validating",
-        "submitted_at": datetime.now().isoformat(),
+        "submitted_at": datetime.fromtimestamp(submitted_at).isoformat(),
+        "submitted_at_ts": submitted_at,
         "last_checked": None,
+        "next_check_at": None,
+        "next_check_at_ts": None,
+        "poll_count": 0,
         "output_dir": output_dir,
         "model_name": model_name,
         "retry_count": 0
@@ -110,30 +166,87 @@ def unregister_batch(project_name):
         print(f"✅ バッチ削除: {project_name}")
 
 
-def check_batch_status_api(batch_id, logger):
+def log_batch_progress(batch, logger):
     """
-    OpenAI API でバッチステータスを確認
+    バッチの進捗情報をログ出力
+    """
+    if hasattr(batch, 'request_counts'):
+        counts = batch.request_counts
+        completed = getattr(counts, 'completed', 0)
+        failed = getattr(counts, 'failed', 0)
+        total = getattr(counts, 'total', 0)
+        logger.log(f"  進捗: {completed}/{total} 完了, {failed} 失敗")
+
+
+def _get_timestamp(project_info, key):
+    """
+    ISO 文字列と並べて保存したエポック秒（"{key}_ts"）を取得
+    
+    _ts が無い古いエントリのみ ISO 文字列をパースし、結果を書き戻す
     
     Returns:
-        tuple: (status, batch_object)
+        float: エポック秒（値が無い場合は None）
     """
-    try:
-        client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-        batch = client.batches.retrieve(batch_id)
-        
-        # 進捗情報
-        if hasattr(batch, 'request_counts'):
-            counts = batch.request_counts
-            completed = getattr(counts, 'completed', 0)
-            failed = getattr(counts, 'failed', 0)
-            total = getattr(counts, 'total', 0)
-            logger.log(f"  進捗: {completed}/{total} 完了, {failed} 失敗")
-        
-        return batch.status, batch
+    ts = project_info.get(f"{key}_ts")
+    if ts is None and project_info.get(key):
+        ts = datetime.fromisoformat(project_info[key]).timestamp()
+        project_info[f"{key}_ts"] = ts
+    return ts
+
+
+def is_check_due(project_info, now):
+    """
+    ポーリング予定時刻を過ぎているか判定（予定なしは即時チェック）
     
-    except Exception as e:
-        logger.log(f"⚠️ API エラー: {e}")
-        return "error", None
+    Args:
+        now (float): 現在時刻（エポック秒）
+    """
+    next_check_at = _get_timestamp(project_info, "next_check_at")
+    return next_check_at is None or next_check_at <= now
+
+
+def adaptive_poll_interval(age_seconds):
+    """
+    バッチの経過時間に応じたポーリング間隔（秒）
+    
+    送信直後ほど間隔を短く、時間が経つほど長くする（10×√経過秒数）
+    BATCH_POLL_BASE_INTERVAL 〜 BATCH_POLL_MAX_INTERVAL に収める
+    """
+    interval = BATCH_POLL_AGE_FACTOR * math.sqrt(max(0.0, age_seconds))
+    return min(BATCH_POLL_MAX_INTERVAL, max(BATCH_POLL_BASE_INTERVAL, interval))
+
+
+def schedule_next_check(project_info, now):
+    """
+    経過時間ベースの間隔 + ジッターで次回ポーリング時刻を設定
+    
+    Args:
+        now (float): 現在時刻（エポック秒）
+    """
+    poll_count = project_info.get("poll_count", 0)
+    submitted_at = _get_timestamp(project_info, "submitted_at")
+    age_seconds = now - submitted_at if submitted_at is not None else 0
+    delay = adaptive_poll_interval(age_seconds) + random.uniform(0, BATCH_POLL_JITTER)
+    
+    project_info["poll_count"] = poll_count + 1
+    project_info["next_check_at"] = datetime.fromtimestamp(now + delay).isoformat()
+    project_info["next_check_at_ts"] = now + delay
+
+
+def seconds_until_next_check(projects, now):
+    """
+    最も早いポーリング予定時刻までの秒数（1秒〜BATCH_CHECK_INTERVAL）
+    """
+    wait = BATCH_CHECK_INTERVAL
+    for project_info in projects.values():
+        if project_info["status"] in ["completed", "failed", "expired", "cancelled"]:
+            continue
+        next_check_at = _get_timestamp(project_info, "next_check_at")
+        if next_check_at is None:
+            return 1
+        remaining = next_check_at - now
+        wait = min(wait, max(1, remaining))
+    return wait
 
 
 def update_current_project(project_name, model_name, output_dir):
@@ -149,8 +262,23 @@ def update_current_project(project_name, model_name, output_dir):
         "start_time": time.time()
     }
     
-    with open(contact_note_file, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    write_json_atomic(contact_note_file, data)
+
+
+def read_log_tail(log_path, max_bytes=500, encoding="utf-8"):
+    """
+    ログファイルの末尾だけを読み込む（ファイル全体はメモリに載せない）
+    
+    Returns:
+        str: 末尾 max_bytes バイト分のテキスト
+    """
+    try:
+        with open(log_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - max_bytes))
+            return f.read().decode(encoding, errors="replace").strip()
+    except OSError:
+        return ""
 
 
 def run_script(script_path, phase_name, logger):
@@ -164,36 +292,105 @@ def run_script(script_path, phase_name, logger):
         logger.log(f"🚨 スクリプトが見つかりません: {script_path}")
         return False
     
-    logger.log(f"\n▶️ {phase_name} を実行中...")
+    # 出力はメモリに溜めず、1行ずつフェーズごとのログファイルとコンソールへ流す
+    phase_log_path = os.path.join(
+        LOGS_DIR, f"phase_{os.path.splitext(os.path.basename(script_path))[0]}.log"
+    )
+    logger.log(f"\n▶️ {phase_name} を実行中... (ログ: {phase_log_path})")
+    logger.flush()
     
     try:
-        import locale
-        system_encoding = locale.getpreferredencoding() or 'utf-8'
+        os.makedirs(LOGS_DIR, exist_ok=True)
+        with open(phase_log_path, "wb") as log_file:
+            proc = subprocess.Popen(
+                [sys.executable, script_path],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT
+            )
+            
+            # 24時間でタイムアウト（出力待ちでブロックしていても強制終了できるようタイマーで kill）
+            timed_out = threading.Event()
+            
+            def kill_on_timeout():
+                timed_out.set()
+                proc.kill()
+            
+            timer = threading.Timer(PHASE_SCRIPT_TIMEOUT, kill_on_timeout)
+            timer.start()
+            try:
+                for line in proc.stdout:
+                    log_file.write(line)
+                    print(line.decode(SYSTEM_ENCODING, errors="replace"), end="", flush=True)
+                returncode = proc.wait()
+            finally:
+                timer.cancel()
         
-        result = subprocess.run(
-            [sys.executable, script_path],
-            capture_output=True,
-            text=True,
-            encoding=system_encoding,
-            errors='replace',
-            timeout=86400  # 24時間
-        )
+        if timed_out.is_set():
+            logger.log(f"❌ {phase_name} タイムアウト")
+            return False
         
-        if result.returncode == 0:
+        if returncode == 0:
             logger.log(f"✅ {phase_name} 完了")
             return True
         else:
-            logger.log(f"❌ {phase_name} 失敗 (終了コード: {result.returncode})")
-            if result.stderr:
-                logger.log(f"  エラー: {result.stderr[:500]}")
+            logger.log(f"❌ {phase_name} 失敗 (終了コード: {returncode})")
+            tail = read_log_tail(phase_log_path, encoding=SYSTEM_ENCODING)
+            if tail:
+                logger.log(f"  エラー: {tail}")
             return False
     
-    except subprocess.TimeoutExpired:
-        logger.log(f"❌ {phase_name} タイムアウト")
+    except Exception as e:
+        logger.log(f"❌ {phase_name} エラー: {e}")
         return False
+
+
+def run_phase_in_process(module_name, phase_name, logger):
+    """
+    フェーズスクリプトを import して main() を直接実行
+    
+    sys.exit() による終了も終了コードとして扱う。
+    PHASE_SCRIPT_TIMEOUT は効かず、フェーズのモジュール状態（キャッシュ等）は次のプロジェクトに持ち越される
+    
+    Returns:
+        bool: 成功時 True
+    """
+    logger.log(f"\n▶️ {phase_name} を実行中...")
+    
+    try:
+        module = importlib.import_module(module_name)
+        result = module.main()
+        success = result is not False
+        exit_code = 0 if success else 1
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        success = exit_code == 0
     except Exception as e:
         logger.log(f"❌ {phase_name} エラー: {e}")
         return False
+    
+    if success:
+        logger.log(f"✅ {phase_name} 完了")
+    else:
+        logger.log(f"❌ {phase_name} 失敗 (終了コード: {exit_code})")
+    return success
+
+
+def run_phase(script_path, phase_name, logger):
+    """
+    フェーズを実行（サブプロセス or プロセス内）
+    
+    Returns:
+        bool: 成功時 True
+    """
+    if not USE_IN_PROCESS_PHASES:
+        return run_script(script_path, phase_name, logger)
+    
+    script_dir = os.path.dirname(script_path)
+    if script_dir not in sys.path:
+        sys.path.insert(0, script_dir)
+    
+    module_name = os.path.splitext(os.path.basename(script_path))[0]
+    return run_phase_in_process(module_name, phase_name, logger)
 
 
 def execute_post_batch_flow(project_name, batch_type, output_dir, model_name, logger):
@@ -215,16 +412,16 @@ def execute_post_batch_flow(project_name, batch_type, output_dir, model_name, lo
     
     if batch_type == "gpt_images":
         # P2-B: バッチ結果取得
-        if not run_script(P2_BATCH_RETRIEVE_SCRIPT, "Phase 2-B (GPT Batch Retrieve)", logger):
+        if not run_phase(P2_BATCH_RETRIEVE_SCRIPT, "Phase 2-B (GPT Batch Retrieve)", logger):
             logger.log("❌ P2-B 失敗。フロー中断。")
             return False
         
         # P2.5: 動画生成
-        if not run_script(P2_5_VIDEO_SCRIPT, "Phase 2.5 (Video Generation)", logger):
+        if not run_phase(P2_5_VIDEO_SCRIPT, "Phase 2.5 (Video Generation)", logger):
             logger.log("⚠️ P2.5 失敗。アップロードは続行します。")
         
         # P3: Google Drive アップロード
-        if not run_script(P3_UPLOAD_SCRIPT, "Phase 3 (Google Drive Upload)", logger):
+        if not run_phase(P3_UPLOAD_SCRIPT, "Phase 3 (Google Drive Upload)", logger):
             logger.log("❌ P3 失敗。")
             return False
     
@@ -241,13 +438,16 @@ def execute_post_batch_flow(project_name, batch_type, output_dir, model_name, lo
     return True
 
 
-def crawler_loop(logger):
+async def crawler_loop_async(logger):
     """
-    メインのクローラーループ
+    メインのクローラーループ（asyncio 上で動作）
+    
+    待機は asyncio.sleep、長時間かかる後続フローはスレッドで実行するため、
+    同じイベントループ上で他のタスクも並行して動かせる
     """
     logger.log(f"\n{'='*60}")
     logger.log(f"🔄 Batch Crawler 開始")
-    logger.log(f"   チェック間隔: {BATCH_CHECK_INTERVAL}秒")
+    logger.log(f"   チェック間隔: {BATCH_POLL_BASE_INTERVAL}〜{BATCH_POLL_MAX_INTERVAL}秒（経過時間に応じて調整）")
     logger.log(f"   状態ファイル: {BATCH_STATUS_FILE}")
     logger.log(f"{'='*60}")
     
@@ -258,29 +458,40 @@ def crawler_loop(logger):
             
             if not projects:
                 logger.log(f"\n⏳ 監視対象のバッチがありません。待機中...")
-                time.sleep(BATCH_CHECK_INTERVAL)
+                logger.flush()
+                await asyncio.sleep(BATCH_CHECK_INTERVAL)
                 continue
             
-            logger.log(f"\n🔍 {len(projects)} 件のバッチを確認中...")
-            
             completed_projects = []
+            now = time.time()
+            now_iso = datetime.fromtimestamp(now).isoformat()
             
-            for project_name, project_info in projects.items():
-                batch_id = project_info["batch_id"]
-                current_status = project_info["status"]
-                
-                # 既に完了/失敗しているものはスキップ
-                if current_status in ["completed", "failed", "expired", "cancelled"]:
-                    continue
-                
-                logger.log(f"\n📋 {project_name}: {batch_id}")
+            # 既に完了/失敗しているもの、ポーリング予定時刻前のものはスキップ
+            pending_projects = [
+                (project_name, project_info)
+                for project_name, project_info in projects.items()
+                if project_info["status"] not in ["completed", "failed", "expired", "cancelled"]
+                and is_check_due(project_info, now)
+            ]
+            
+            if pending_projects:
+                logger.log(f"\n🔍 {len(pending_projects)}/{len(projects)} 件のバッチを確認中...")
+            
+            # API でステータス確認（並列）
+            results = await check_pending_batches(
+                [project_info["batch_id"] for _, project_info in pending_projects],
+                logger.log
+            )
+            
+            for (project_name, project_info), (api_status, batch_obj) in zip(pending_projects, results):
+                logger.log(f"\n📋 {project_name}: {project_info['batch_id']}")
                 
-                # API でステータス確認
-                api_status, batch_obj = check_batch_status_api(batch_id, logger)
+                if batch_obj is not None:
+                    log_batch_progress(batch_obj, logger)
                 
                 # 状態を更新
                 project_info["status"] = api_status
-                project_info["last_checked"] = datetime.now().isoformat()
+                project_info["last_checked"] = now_iso
                 
                 if api_status == "completed":
                     logger.log(f"✅ バッチ完了: {project_name}")
@@ -299,6 +510,10 @@ def crawler_loop(logger):
                 
                 else:
                     logger.log(f"  ステータス: {api_status}")
+                
+                # 未完了なら次回ポーリングを後ろにずらす
+                if api_status not in ["completed", "failed", "expired", "cancelled"]:
+                    schedule_next_check(project_info, now)
             
             # 状態を保存
             save_batch_status(status_data)
@@ -307,7 +522,9 @@ def crawler_loop(logger):
             for project_name in completed_projects:
                 project_info = projects[project_name]
                 
-                success = execute_post_batch_flow(
+                # 後続フローはブロッキング処理のためスレッドで実行
+                success = await asyncio.to_thread(
+                    execute_post_batch_flow,
                     project_name,
                     project_info["batch_type"],
                     project_info["output_dir"],
@@ -321,21 +538,21 @@ def crawler_loop(logger):
                 else:
                     # 失敗した場合は状態を更新
                     project_info["status"] = "post_flow_failed"
+                    schedule_next_check(project_info, time.time())
                     save_batch_status(status_data)
             
             # 次のチェックまで待機
-            logger.log(f"\n⏳ 次のチェックまで {BATCH_CHECK_INTERVAL}秒待機...")
-            time.sleep(BATCH_CHECK_INTERVAL)
-        
-        except KeyboardInterrupt:
-            logger.log("\n\n🛑 Crawler 停止（Ctrl+C）")
-            break
+            wait_seconds = seconds_until_next_check(projects, time.time())
+            if pending_projects:
+                logger.log(f"\n⏳ 次のチェックまで {wait_seconds:.0f}秒待機...")
+            logger.flush()
+            await asyncio.sleep(wait_seconds)
         
         except Exception as e:
             logger.log(f"\n🚨 予期せぬエラー: {e}")
-            import traceback
             logger.log(traceback.format_exc())
-            time.sleep(60)  # エラー時は1分待機
+            logger.flush()
+            await asyncio.sleep(60)  # エラー時は1分待機
 
 
 def show_status():
@@ -373,9 +590,19 @@ def main():
     command = sys.argv[1].lower()
     
     if command == "start":
+        # API キー確認（ループ内では毎回確認しない）
+        if not os.environ.get("OPENAI_API_KEY"):
+            print("🚨 OPENAI_API_KEY が設定されていません")
+            sys.exit(1)
+        
         os.makedirs(LOGS_DIR, exist_ok=True)
-        logger = DualLogger(CRAWLER_LOG_FILE)
-        crawler_loop(logger)
+        # 常駐プロセスなので行ごとにフラッシュせず、ループ1周ごとにまとめて出力
+        logger = DualLogger(CRAWLER_LOG_FILE, flush_each_line=False)
+        try:
+            asyncio.run(crawler_loop_async(logger))
+        except KeyboardInterrupt:
+            logger.log("\n\n🛑 Crawler 停止（Ctrl+C）")
+            logger.flush()
     
     elif command == "status":
         show_status()
@@ -17,7 +17,6 @@ Checker Job から Cloud Run Job として起動される
 """
 import os
 import sys
-import json
 import subprocess
 from datetime import datetime
 from dotenv import load_dotenv
@@ -25,7 +24,10 @@ from dotenv import load_dotenv
 # 親ディレクトリをパスに追加
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from google.cloud import storage
+from google.api_core.exceptions import NotFound, NotModified, PreconditionFailed
+from config import BATCH_STATUS_SAVE_MAX_ATTEMPTS
+from json_utils import json_dumps_bytes, json_loads, write_json_atomic
+from gcs_utils import get_gcs_client
 
 load_dotenv()
 
@@ -40,6 +42,11 @@ P2_5_VIDEO_SCRIPT = os.path.join(BASE_DIR, "p2_5_hailuo_generate_videos.py")
 P3_UPLOAD_SCRIPT = os.path.join(BASE_DIR, "p3_gdrive_upload.py")
 CONTACT_NOTE_FILE = os.path.join(BASE_DIR, "_current_project.json")
 
+# batch_status.json のバケット（クライアントは gcs_utils でプロセス内共有）
+_status_bucket = None
+# 最後に読み書きした batch_status.json の (generation, 本体 bytes)。変更が無ければ再ダウンロードしない
+_status_cache = None
+
 
 def update_current_project(project_name, model_name, output_dir):
     """
@@ -54,8 +61,7 @@ def update_current_project(project_name, model_name, output_dir):
         "start_time": time.time()
     }
     
-    with open(CONTACT_NOTE_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    write_json_atomic(CONTACT_NOTE_FILE, data)
     
     print(f"📝 _current_project.json を更新しました")
 
@@ -73,26 +79,18 @@ def run_script(script_path, phase_name):
     print(f"{'='*50}")
     
     try:
+        # 出力はメモリに溜めず、そのまま Cloud Logging（標準出力）に流す
+        sys.stdout.flush()
         result = subprocess.run(
             [sys.executable, script_path],
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
             timeout=86400  # 24時間
         )
         
-        # 出力を表示
-        if result.stdout:
-            print(result.stdout)
-        
         if result.returncode == 0:
             print(f"✅ {phase_name} 完了")
             return True
         else:
             print(f"❌ {phase_name} 失敗 (終了コード: {result.returncode})")
-            if result.stderr:
-                print(f"エラー: {result.stderr[:1000]}")
             return False
     
     except subprocess.TimeoutExpired:
@@ -103,32 +101,86 @@ def run_script(script_path, phase_name):
         return False
 
 
-def update_batch_status_in_gcs(project_name, new_status):
+def _get_status_bucket():
     """
-    GCS の batch_status.json を更新
+    batch_status.json のバケットを取得（初回のみ生成、以降は使い回す）
+    
+    Blob は読み書きした generation を保持し、以降の読み込みがその世代に固定されるため、
+    使い回さずに読み書きのたびに生成すること
     """
-    if not GCS_BUCKET:
-        return
+    global _status_bucket
+    if _status_bucket is None:
+        _status_bucket = get_gcs_client().bucket(GCS_BUCKET)
+    return _status_bucket
+
+
+def modify_batch_status_in_gcs(modify):
+    """
+    GCS の batch_status.json を読み込み → modify(status_data) → 保存
     
-    try:
-        client = storage.Client()
-        bucket = client.bucket(GCS_BUCKET)
+    読み込み時の generation を条件に保存し、他のジョブが先に更新していた場合は
+    読み直して modify を再適用する（最大 BATCH_STATUS_SAVE_MAX_ATTEMPTS 回）
+    
+    前回読み書きした generation から変わっていなければ本体はダウンロードせず、
+    手元のコピーを使う（条件付き GET）
+    
+    Args:
+        modify: status_data を直接更新する関数。変更した場合は True を返す
+    
+    Returns:
+        bool: 保存した場合 True
+    """
+    global _status_cache
+    bucket = _get_status_bucket()
+    
+    for attempt in range(1, BATCH_STATUS_SAVE_MAX_ATTEMPTS + 1):
+        # 前回の試行で読み込んだ世代に固定されないよう、Blob は毎回作り直す
         blob = bucket.blob(BATCH_STATUS_BLOB)
+        try:
+            cached_generation = _status_cache[0] if _status_cache else None
+            content = blob.download_as_bytes(if_generation_not_match=cached_generation)
+            generation = blob.generation
+        except NotModified:
+            generation, content = _status_cache
+        except NotFound:
+            return False
         
-        if not blob.exists():
-            return
-        
-        content = blob.download_as_text()
-        status_data = json.loads(content)
+        status_data = json_loads(content)
+        if not modify(status_data):
+            _status_cache = (generation, content)
+            return False
         
-        if project_name in status_data.get("projects", {}):
-            status_data["projects"][project_name]["status"] = new_status
-            status_data["projects"][project_name]["completed_at"] = datetime.now().isoformat()
-            
+        payload = json_dumps_bytes(status_data, indent=True)
+        try:
             blob.upload_from_string(
-                json.dumps(status_data, ensure_ascii=False, indent=2),
-                content_type="application/json"
+                payload,
+                content_type="application/json",
+                if_generation_match=generation
             )
+            _status_cache = (blob.generation, payload)
+            return True
+        except PreconditionFailed:
+            print(f"⚠️ batch_status.json が他のジョブに更新されていました。再試行します ({attempt}/{BATCH_STATUS_SAVE_MAX_ATTEMPTS})")
+    
+    raise RuntimeError(f"競合が {BATCH_STATUS_SAVE_MAX_ATTEMPTS} 回続きました")
+
+
+def update_batch_status_in_gcs(project_name, new_status):
+    """
+    GCS の batch_status.json を更新
+    """
+    if not GCS_BUCKET:
+        return
+    
+    def modify(status_data):
+        if project_name not in status_data.get("projects", {}):
+            return False
+        status_data["projects"][project_name]["status"] = new_status
+        status_data["projects"][project_name]["completed_at"] = datetime.now().isoformat()
+        return True
+    
+    try:
+        if modify_batch_status_in_gcs(modify):
             print(f"✅ batch_status.json を更新しました: {project_name} → {new_status}")
     
     except Exception as e:
@@ -142,24 +194,14 @@ def remove_from_batch_status(project_name):
     if not GCS_BUCKET:
         return
     
+    def modify(status_data):
+        if project_name not in status_data.get("projects", {}):
+            return False
+        del status_data["projects"][project_name]
+        return True
+    
     try:
-        client = storage.Client()
-        bucket = client.bucket(GCS_BUCKET)
-        blob = bucket.blob(BATCH_STATUS_BLOB)
-        
-        if not blob.exists():
-            return
-        
-        content = blob.download_as_text()
-        status_data = json.loads(content)
-        
-        if project_name in status_data.get("projects", {}):
-            del status_data["projects"][project_name]
-            
-            blob.upload_from_string(
-                json.dumps(status_data, ensure_ascii=False, indent=2),
-                content_type="application/json"
-            )
+        if modify_batch_status_in_gcs(modify):
             print(f"✅ {project_name} を batch_status.json から削除しました")
     
     except Exception as e:
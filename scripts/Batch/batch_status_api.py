@@ -0,0 +1,107 @@
+"""
+OpenAI Batch API のステータス確認（batch_crawler / batch_checker_job 共通）
+ログの出力先（logger.log / print）は呼び出し元から関数で受け取る
+"""
+import os
+import asyncio
+
+import httpx
+from openai import AsyncOpenAI, APITimeoutError, APIConnectionError
+from config import (
+    BATCH_CHECK_CONCURRENCY, BATCH_LIST_PAGE_SIZE, BATCH_LIST_MAX_PAGES,
+    BATCH_STATUS_API_TIMEOUT, BATCH_STATUS_API_CONNECT_TIMEOUT, BATCH_STATUS_API_MAX_RETRIES
+)
+
+# クライアントはプロセス内で使い回す（接続プールを再利用）
+_openai_client = None
+
+
+def _get_client():
+    """
+    OpenAI クライアントを取得（初回のみ生成）
+    """
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = AsyncOpenAI(
+            api_key=os.environ["OPENAI_API_KEY"],
+            timeout=httpx.Timeout(BATCH_STATUS_API_TIMEOUT, connect=BATCH_STATUS_API_CONNECT_TIMEOUT),
+            max_retries=BATCH_STATUS_API_MAX_RETRIES
+        )
+    return _openai_client
+
+
+async def check_batch_status_api(batch_id, log):
+    """
+    OpenAI API でバッチステータスを確認
+    
+    Args:
+        batch_id: バッチID
+        log: ログ出力関数
+    
+    Returns:
+        tuple: (status, batch_object)
+    """
+    try:
+        client = _get_client()
+        batch = await client.batches.retrieve(batch_id)
+        return batch.status, batch
+    
+    except (APITimeoutError, APIConnectionError) as e:
+        # 応答が遅い/接続できない場合は諦めて次回のポーリングでリトライ
+        log(f"⏱️ API タイムアウト/接続エラー ({batch_id}): {e}")
+        return "error", None
+    
+    except Exception as e:
+        log(f"⚠️ API エラー ({batch_id}): {e}")
+        return "error", None
+
+
+async def list_recent_batches(batch_ids, log):
+    """
+    batches.list で直近のバッチをまとめて取得し、batch_ids に含まれるものを返す
+    
+    新しい順に最大 BATCH_LIST_MAX_PAGES ページまで辿り、全て見つかった時点で打ち切る
+    
+    Returns:
+        dict: {batch_id: batch_object}（見つからなかったものは含まない）
+    """
+    wanted = set(batch_ids)
+    found = {}
+    
+    try:
+        client = _get_client()
+        page = await client.batches.list(limit=BATCH_LIST_PAGE_SIZE)
+        for _ in range(BATCH_LIST_MAX_PAGES):
+            for batch in page.data:
+                if batch.id in wanted:
+                    found[batch.id] = batch
+            if len(found) == len(wanted) or not page.has_next_page():
+                break
+            page = await page.get_next_page()
+    
+    except Exception as e:
+        log(f"⚠️ バッチ一覧の取得エラー（個別に確認します）: {e}")
+    
+    return found
+
+
+async def check_pending_batches(batch_ids, log):
+    """
+    複数バッチのステータスを確認
+    
+    2件以上なら batches.list で一括取得し、一覧に無かったものだけ
+    個別に retrieve する（同時実行数は BATCH_CHECK_CONCURRENCY まで）
+    
+    Returns:
+        list: batch_ids と同じ順序の (status, batch_object) のリスト
+    """
+    listed = await list_recent_batches(batch_ids, log) if len(batch_ids) > 1 else {}
+    semaphore = asyncio.Semaphore(BATCH_CHECK_CONCURRENCY)
+    
+    async def bounded_retrieve(batch_id):
+        if batch_id in listed:
+            return listed[batch_id].status, listed[batch_id]
+        async with semaphore:
+            return await check_batch_status_api(batch_id, log)
+    
+    return await asyncio.gather(*[bounded_retrieve(batch_id) for batch_id in batch_ids])
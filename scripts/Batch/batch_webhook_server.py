@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Batch Webhook Server: OpenAI のバッチ完了 Webhook を受け取る Cloud Run サービス
+
+【機能】
+1. POST /openai/batch-webhook で OpenAI からの Webhook を受信
+2. 署名（Standard Webhooks 形式）を検証
+3. batch_status.json (Cloud Storage) の該当プロジェクトを更新
+4. 完了していれば Post-flow Job を即座に起動
+
+【Checker Job との関係】
+Webhook が正常系、Checker Job は取りこぼし用のフォールバック（1時間ごと）
+"""
+import os
+import sys
+import hmac
+import time
+import base64
+import hashlib
+from datetime import datetime
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+# 親ディレクトリをパスに追加
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_utils import json_loads
+from batch_checker_job import (
+    is_batch_status_saved,
+    load_batch_status_from_gcs,
+    save_batch_status_to_gcs,
+    trigger_post_flow_job,
+)
+
+# === 設定 ===
+WEBHOOK_PATH = "/openai/batch-webhook"
+WEBHOOK_SECRET = os.environ.get("OPENAI_WEBHOOK_SECRET", "")
+WEBHOOK_TOLERANCE_SECONDS = 300  # タイムスタンプの許容誤差（リプレイ対策）
+PORT = int(os.environ.get("PORT", "8080"))
+
+# Webhook イベント種別 → batch_status.json のステータス
+BATCH_EVENT_STATUS = {
+    "batch.completed": "completed",
+    "batch.failed": "failed",
+    "batch.expired": "expired",
+    "batch.cancelled": "cancelled",
+}
+
+
+def verify_webhook_signature(body, headers):
+    """
+    OpenAI Webhook の署名を検証（Standard Webhooks 形式）
+
+    署名対象は "{webhook-id}.{webhook-timestamp}.{body}" で、
+    シークレット（whsec_ 以降を base64 デコード）による HMAC-SHA256
+
+    Args:
+        body (bytes): リクエストボディ
+        headers: リクエストヘッダー
+
+    Returns:
+        bool: 署名が正しければ True
+    """
+    webhook_id = headers.get("webhook-id")
+    timestamp = headers.get("webhook-timestamp")
+    signature_header = headers.get("webhook-signature")
+
+    if not (webhook_id and timestamp and signature_header):
+        return False
+
+    try:
+        if abs(time.time() - int(timestamp)) > WEBHOOK_TOLERANCE_SECONDS:
+            return False
+
+        secret = WEBHOOK_SECRET
+        if secret.startswith("whsec_"):
+            secret = secret[len("whsec_"):]
+        key = base64.b64decode(secret)
+    except ValueError:
+        return False
+
+    signed_content = f"{webhook_id}.{timestamp}.".encode("utf-8") + body
+    expected = base64.b64encode(
+        hmac.new(key, signed_content, hashlib.sha256).digest()
+    ).decode("utf-8")
+
+    # "v1,<署名> v1,<署名>" の形式（シークレットのローテーション中は複数）
+    for entry in signature_header.split():
+        version, _, signature = entry.partition(",")
+        if version == "v1" and hmac.compare_digest(signature, expected):
+            return True
+
+    return False
+
+
+def handle_batch_event(event):
+    """
+    バッチイベントを batch_status.json に反映し、完了なら Post-flow Job を起動
+
+    Args:
+        event (dict): Webhook のペイロード
+    """
+    event_type = event.get("type", "")
+    new_status = BATCH_EVENT_STATUS.get(event_type)
+    if new_status is None:
+        print(f"⏭️ 対象外のイベントです: {event_type}")
+        return
+
+    batch_id = event.get("data", {}).get("id")
+
+    status_data, generation = load_batch_status_from_gcs()
+    if generation is None:
+        # 読み込めなかったものを「未登録」と扱うとイベントを取りこぼすため、500 を返して再送させる
+        raise RuntimeError("batch_status.json を読み込めませんでした")
+    projects = status_data.get("projects", {})
+
+    project_name = next(
+        (name for name, info in projects.items() if info.get("batch_id") == batch_id),
+        None
+    )
+    if project_name is None:
+        print(f"⚠️ batch_status.json に登録されていないバッチです: {batch_id}")
+        return
+
+    project_info = projects[project_name]
+    # "completed" は起動に失敗して再送されたイベントの可能性があるため、起動済みのみスキップ
+    if project_info.get("status") == "post_flow_started":
+        print(f"⏭️ 処理済みのバッチです: {project_name} ({project_info['status']})")
+        return
+
+    print(f"\n📋 {project_name}")
+    print(f"   Batch ID: {batch_id}")
+
+    project_info["status"] = new_status
+    project_info["last_checked"] = datetime.now().isoformat()
+    generation = save_batch_status_to_gcs(status_data, generation)
+    if not is_batch_status_saved(status_data):
+        raise RuntimeError("batch_status.json を保存できませんでした")
+
+    if new_status != "completed":
+        print(f"❌ バッチ失敗: {project_name} ({new_status})")
+        return
+
+    print(f"✅ バッチ完了: {project_name}")
+
+    # マージで他のジョブが既に起動済み/削除済みになっていればスキップ
+    project_info = projects.get(project_name, {})
+    if project_info.get("status") != "completed":
+        return
+
+    if not trigger_post_flow_job(project_name, project_info):
+        # "completed" のまま 500 を返し、再送されたイベントで起動し直す
+        raise RuntimeError(f"Post-flow Job を起動できませんでした: {project_name}")
+
+    # 状態を更新（重複起動防止）
+    project_info["status"] = "post_flow_started"
+    project_info["post_flow_started_at"] = datetime.now().isoformat()
+    save_batch_status_to_gcs(status_data, generation)
+
+
+class BatchWebhookHandler(BaseHTTPRequestHandler):
+    """OpenAI Webhook のリクエストハンドラー"""
+
+    def do_POST(self):
+        if self.path != WEBHOOK_PATH:
+            self._respond(404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+
+        if not verify_webhook_signature(body, self.headers):
+            print("🚨 Webhook の署名検証に失敗しました")
+            self._respond(400)
+            return
+
+        try:
+            event = json_loads(body)
+        except ValueError:
+            print("🚨 Webhook のペイロードが不正です")
+            self._respond(400)
+            return
+
+        try:
+            handle_batch_event(event)
+        except Exception as e:
+            # 500 を返せば OpenAI 側で再送される
+            print(f"❌ Webhook 処理エラー: {e}")
+            self._respond(500)
+            return
+
+        self._respond(200)
+
+    def _respond(self, status):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def main():
+    """メイン処理"""
+    if not WEBHOOK_SECRET:
+        print("🚨 OPENAI_WEBHOOK_SECRET が設定されていません")
+        sys.exit(1)
+
+    # batch_status.json の読み書き状態をモジュール内で共有するため、リクエストは逐次処理する
+    server = HTTPServer(("", PORT), BatchWebhookHandler)
+    print(f"🚀 Batch Webhook Server 起動 (port: {PORT}, path: {WEBHOOK_PATH})")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,12 @@ import time
 import anthropic
 from datetime import datetime
 from dotenv import load_dotenv
-from config import BATCH_CHECK_INTERVAL, BATCH_MAX_WAIT_TIME
+from config import (
+    BATCH_MAX_WAIT_TIME, BATCH_RETRIEVE_API_TIMEOUT, BATCH_RETRIEVE_API_MAX_RETRIES
+)
+from api_retry_utils import is_retryable_api_error, next_poll_interval, retry_after_seconds
 from logger_utils import DualLogger
+from json_utils import write_json_atomic
 from project_utils import get_current_project_info
 
 load_dotenv()
@@ -14,6 +18,24 @@ load_dotenv()
 log_file = os.path.join(os.path.dirname(__file__), "..", "logs", "batch_retrieve.log")
 logger = DualLogger(log_file, include_timestamp=True)
 
+PROMPTS_WRITE_BUFFER_SIZE = 1 << 20  # 1MB
+
+# Anthropic クライアント（ポーリングごとに作り直さず、接続を使い回す）
+_anthropic_client = None
+
+def _get_client():
+    """
+    Anthropic クライアントを取得（初回のみ生成）
+    """
+    global _anthropic_client
+    if _anthropic_client is None:
+        _anthropic_client = anthropic.Anthropic(
+            api_key=os.environ.get("ANTHROPIC_API_KEY"),
+            timeout=BATCH_RETRIEVE_API_TIMEOUT,
+            max_retries=BATCH_RETRIEVE_API_MAX_RETRIES
+        )
+    return _anthropic_client
+
 def load_batch_info(project_folder):
     """バッチ情報を読み込み"""
     batch_info_file = os.path.join(project_folder, "batch_info.json")
@@ -26,50 +48,55 @@ def load_batch_info(project_folder):
 
 def check_batch_status(batch_id):
     """バッチのステータスを確認"""
-    client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+    client = _get_client()
     batch = client.messages.batches.retrieve(batch_id)
     return batch
 
+def parse_prompt_index(custom_id):
+    """custom_id（prompt_001 形式）から 0 始まりのインデックスを取得"""
+    return int(custom_id.rsplit("_", 1)[1]) - 1
+
 def retrieve_batch_results(batch_id, project_folder):
     """バッチ結果を取得して保存"""
-    client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+    client = _get_client()
+    
+    batch_info_file = os.path.join(project_folder, "batch_info.json")
+    with open(batch_info_file, "r", encoding="utf-8") as f:
+        batch_info = json.load(f)
     
     logger.log(f"バッチ結果を取得中: {batch_id}")
     
-    # 結果を取得
-    results = []
+    # custom_id の連番どおりの位置に直接格納（ソート不要・欠番は None のまま残る）
+    results = [None] * batch_info.get("request_count", 0)
     for result in client.messages.batches.results(batch_id):
         if result.result.type == "succeeded":
-            custom_id = result.custom_id
-            content = result.result.message.content[0].text
-            results.append({
-                "custom_id": custom_id,
-                "content": content
-            })
+            index = parse_prompt_index(result.custom_id)
+            if index >= len(results):
+                results.extend([None] * (index + 1 - len(results)))
+            results[index] = result.result.message.content[0].text
         else:
             logger.log(f"失敗: {result.custom_id}")
     
-    logger.log(f"取得成功: {len(results)}件")
+    success_count = sum(1 for content in results if content is not None)
+    logger.log(f"取得成功: {success_count}件")
     
-    # prompts_list.txt に保存
+    missing = [f"prompt_{i:03d}" for i, content in enumerate(results, 1) if content is None]
+    if missing:
+        logger.log(f"⚠️ 欠番: {', '.join(missing)}")
+    
+    # prompts_list.txt に保存（1つの文字列にまとめて1回で書き込む）
     prompts_file = os.path.join(project_folder, "prompts_list.txt")
-    with open(prompts_file, "w", encoding="utf-8") as f:
-        for result in sorted(results, key=lambda x: x["custom_id"]):
-            f.write(result["content"] + "\n")
+    with open(prompts_file, "w", encoding="utf-8", buffering=PROMPTS_WRITE_BUFFER_SIZE) as f:
+        f.write("".join(content + "\n" for content in results if content is not None))
     
     logger.log(f"プロンプト保存完了: {prompts_file}")
     
     # バッチ情報を更新
-    batch_info_file = os.path.join(project_folder, "batch_info.json")
-    with open(batch_info_file, "r", encoding="utf-8") as f:
-        batch_info = json.load(f)
-    
     batch_info["status"] = "completed"
     batch_info["completed_at"] = datetime.now().isoformat()
-    batch_info["results_count"] = len(results)
+    batch_info["results_count"] = success_count
     
-    with open(batch_info_file, "w", encoding="utf-8") as f:
-        json.dump(batch_info, f, ensure_ascii=False, indent=2)
+    write_json_atomic(batch_info_file, batch_info)
 
 def main():
     try:
@@ -88,30 +115,47 @@ def main():
         
         # ステータス確認ループ
         start_time = time.time()
+        poll_count = 0
         while True:
-            batch = check_batch_status(batch_id)
+            poll_count += 1
+            try:
+                batch = check_batch_status(batch_id)
+            except (anthropic.APIConnectionError, anthropic.APIStatusError) as e:
+                # SDK のリトライでも回復しなかった一時的なエラーは、Retry-After を尊重して次回に持ち越す
+                if not is_retryable_api_error(e) or time.time() - start_time > BATCH_MAX_WAIT_TIME:
+                    raise
+                wait_seconds = max(retry_after_seconds(e) or 0.0, next_poll_interval(poll_count))
+                logger.log(f"⚠️ ステータス確認エラー（{wait_seconds:.0f}秒後に再試行）: {e}")
+                time.sleep(wait_seconds)
+                continue
             status = batch.processing_status
-            
-            logger.log(f"ステータス: {status}")
+            elapsed = time.time() - start_time
             
             if status == "ended":
+                logger.log(f"ステータス: {status}")
                 logger.log("✅ バッチ処理完了")
                 break
             elif status in ["canceling", "canceled", "expired"]:
+                logger.log(f"ステータス: {status}")
                 logger.log(f"❌ バッチ失敗: {status}")
                 logger.save_on_error()
                 return False
             
             # タイムアウトチェック
-            elapsed = time.time() - start_time
             if elapsed > BATCH_MAX_WAIT_TIME:
                 logger.log("❌ タイムアウト")
                 logger.save_on_error()
                 return False
             
-            # 待機
-            logger.log(f"次回チェックまで {BATCH_CHECK_INTERVAL}秒待機...")
-            time.sleep(BATCH_CHECK_INTERVAL)
+            # 待機（1回の確認につきログは1行にまとめる）
+            wait_seconds = next_poll_interval(poll_count)
+            counts = batch.request_counts
+            logger.log(
+                f"#{poll_count} [{elapsed/60:.1f}分経過] ステータス: {status} / "
+                f"処理中: {counts.processing}, 成功: {counts.succeeded}, エラー: {counts.errored} / "
+                f"次回 {wait_seconds:.0f}秒後"
+            )
+            time.sleep(wait_seconds)
         
         # 結果取得
         retrieve_batch_results(batch_id, project_folder)
@@ -1,10 +1,10 @@
 import os
-import json
 import anthropic
 from datetime import datetime
 from dotenv import load_dotenv
 from config import CLAUDE_MODEL, CLAUDE_MAX_TOKENS
 from logger_utils import DualLogger
+from json_utils import write_json_atomic
 from project_utils import get_current_project_info, read_file_safely
 
 load_dotenv()
@@ -13,6 +13,10 @@ load_dotenv()
 log_file = os.path.join(os.path.dirname(__file__), "..", "logs", "batch_submit.log")
 logger = DualLogger(log_file, include_timestamp=True)
 
+# 台本ファイルではない .txt（ファイル名に含まれるキーワード）
+NON_SCRIPT_TXT_KEYWORDS = ("character_settings", "prompts_list")
+SCRIPT_READ_BUFFER_SIZE = 1 << 20  # 1MB
+
 def load_rules_and_settings(project_folder):
     """ルールファイルとキャラクター設定を読み込み"""
     base_dir = os.path.dirname(__file__)
@@ -31,19 +35,28 @@ def load_rules_and_settings(project_folder):
     
     return character_settings, image_rules
 
+def is_script_file(entry):
+    """os.scandir のエントリが台本ファイル（設定・プロンプト一覧以外の .txt）か判定"""
+    name = entry.name
+    return (
+        name.endswith('.txt')
+        and not any(excluded in name for excluded in NON_SCRIPT_TXT_KEYWORDS)
+        and entry.is_file()
+    )
+
 def load_script_lines(project_folder):
     """台本を1行ずつ読み込み"""
-    # プロジェクトフォルダ内の台本ファイルを探す
-    script_files = [f for f in os.listdir(project_folder) if f.endswith('.txt') and 'character_settings' not in f and 'prompts_list' not in f]
+    # プロジェクトフォルダ内の台本ファイルを探す（最初に見つかった時点で打ち切り）
+    with os.scandir(project_folder) as entries:
+        script_file = next((entry.path for entry in entries if is_script_file(entry)), None)
     
-    if not script_files:
+    if script_file is None:
         raise FileNotFoundError("台本ファイルが見つかりません")
     
-    script_file = os.path.join(project_folder, script_files[0])
     logger.log(f"台本ファイル: {script_file}")
     
-    with open(script_file, "r", encoding="utf-8") as f:
-        lines = [line.strip() for line in f if line.strip()]
+    with open(script_file, "r", encoding="utf-8", buffering=SCRIPT_READ_BUFFER_SIZE) as f:
+        lines = [stripped for stripped in (line.strip() for line in f) if stripped]
     
     return lines
 
@@ -108,8 +121,7 @@ def submit_batch_job(requests, project_folder):
     }
     
     batch_info_file = os.path.join(project_folder, "batch_info.json")
-    with open(batch_info_file, "w", encoding="utf-8") as f:
-        json.dump(batch_info, f, ensure_ascii=False, indent=2)
+    write_json_atomic(batch_info_file, batch_info)
     
     logger.log(f"バッチ情報を保存: {batch_info_file}")
     return batch_id
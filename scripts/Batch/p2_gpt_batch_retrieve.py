@@ -13,11 +13,21 @@ OpenAI Batch API の結果を取得し、画像を保存
 import os
 import sys
 import json
+import re
 import time
-import base64
+import binascii
+import asyncio
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APIStatusError
+
+# pybase64 をインポート（存在する場合のみ）
+try:
+    import pybase64
+    PYBASE64_AVAILABLE = True
+except ImportError:
+    PYBASE64_AVAILABLE = False
 
 # 親ディレクトリをパスに追加
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -25,10 +35,16 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from logger_utils import DualLogger
 from project_utils import read_project_info, get_output_dir, ensure_image_output_dir
 from config import (
-    LOGS_DIR, BATCH_CHECK_INTERVAL, BATCH_MAX_WAIT_TIME
+    LOGS_DIR, BATCH_MAX_WAIT_TIME, DRIVE_UPLOAD_CONCURRENCY,
+    BATCH_RETRIEVE_API_TIMEOUT, BATCH_RETRIEVE_API_MAX_RETRIES
 )
+from api_retry_utils import is_retryable_api_error, next_poll_interval, retry_after_seconds
 from cost_tracker import CostTracker
-from gdrive_checkpoint import authenticate_gdrive, find_project_folder_on_drive
+from json_utils import json_loads, write_json_atomic
+from gdrive_checkpoint import (
+    find_images_folder_on_drive, find_project_folder_on_drive, get_drive_service,
+    list_files_in_drive_folder, remember_folder_on_drive
+)
 
 load_dotenv()
 
@@ -38,6 +54,38 @@ MODEL_PRICES = {
     "gpt-image-1-mini": 0.052
 }
 
+# 画像のデコード・保存の並列数
+IMAGE_DECODE_WORKERS = os.cpu_count() or 4
+# base64 を分割デコードする単位（4 の倍数 = base64 の区切り。デコード後 約64KB）
+B64_DECODE_CHUNK = 87376
+# 画像保存の進捗ログを出す間隔（枚数）。1枚ごとには出さない
+IMAGE_SAVE_LOG_INTERVAL = 25
+# 書き込み前にデコード後のサイズ分のディスク領域を確保できるか（Linux など POSIX のみ）
+FALLOCATE_AVAILABLE = hasattr(os, "posix_fallocate")
+
+# バッチリクエスト1行から custom_id と body.model を取り出す（model は prompt より前に書かれる）
+MODEL_MAP_PATTERN = re.compile(rb'"custom_id"\s*:\s*"([^"]+)".*?"model"\s*:\s*"([^"]+)"')
+
+# クライアントはプロセス内で使い回す（クローラーから in-process 実行された場合も接続を再利用）
+_openai_client = None
+
+# アップロード済みのファイル名（Drive の認証情報・フォルダIDは gdrive_checkpoint でキャッシュ）
+_drive_existing_files = {}  # images フォルダID -> アップロード済みファイル名の set
+
+
+def _get_client():
+    """
+    OpenAI クライアントを取得（初回のみ生成）
+    """
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = OpenAI(
+            api_key=os.environ.get("OPENAI_API_KEY"),
+            timeout=BATCH_RETRIEVE_API_TIMEOUT,
+            max_retries=BATCH_RETRIEVE_API_MAX_RETRIES
+        )
+    return _openai_client
+
 
 def load_batch_info(project_folder, logger):
     """
@@ -53,41 +101,45 @@ def load_batch_info(project_folder, logger):
         return json.load(f)
 
 
-def check_batch_status(batch_id, logger):
+def check_batch_status(batch_id):
     """
     バッチのステータスを確認
     """
-    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-    batch = client.batches.retrieve(batch_id)
-    
-    # 進捗情報を表示
-    if hasattr(batch, 'request_counts'):
-        counts = batch.request_counts
-        completed = getattr(counts, 'completed', 0)
-        failed = getattr(counts, 'failed', 0)
-        total = getattr(counts, 'total', 0)
-        logger.log(f"  進捗: {completed}/{total} 完了, {failed} 失敗")
-    
-    return batch
+    client = _get_client()
+    return client.batches.retrieve(batch_id)
 
 
-def upload_image_to_drive(image_path, project_name, logger):
+def format_progress(batch):
     """
-    画像を Google Drive に即座にアップロード
+    バッチの進捗を1行表示用の文字列にする（request_counts が無ければ空文字）
+    """
+    counts = getattr(batch, 'request_counts', None)
+    if not counts:
+        return ""
+    completed = getattr(counts, 'completed', 0)
+    failed = getattr(counts, 'failed', 0)
+    total = getattr(counts, 'total', 0)
+    return f" / 進捗: {completed}/{total} 完了, {failed} 失敗"
+
+
+def prepare_drive_upload(project_name, logger):
+    """
+    アップロード先（プロジェクト/images フォルダ）を1回だけ解決し、
+    既存ファイル名を一括取得する（フォルダIDは gdrive_checkpoint でプロセス内キャッシュ）
+    
+    並列アップロード前に実行し、フォルダの重複作成を防ぐ
+    
+    Returns:
+        str: images フォルダID。Drive 未設定/エラー時は None
     """
     try:
-        from googleapiclient.http import MediaFileUpload
-        from googleapiclient.discovery import build
-        
         parent_folder_id = os.getenv("GDRIVE_PARENT_FOLDER_ID")
         if not parent_folder_id:
-            return
+            return None
         
-        creds = authenticate_gdrive()
-        if not creds:
-            return
-        
-        service = build('drive', 'v3', credentials=creds)
+        service = get_drive_service()
+        if not service:
+            return None
         
         # プロジェクトフォルダを検索
         project_folder_id = find_project_folder_on_drive(service, project_name, parent_folder_id)
@@ -101,14 +153,14 @@ def upload_image_to_drive(image_path, project_name, logger):
             }
             folder = service.files().create(body=folder_metadata, fields='id').execute()
             project_folder_id = folder.get('id')
+            remember_folder_on_drive(project_name, parent_folder_id, project_folder_id)
         
         # images フォルダを検索または作成
-        query = f"name='images' and '{project_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
-        results = service.files().list(q=query, spaces='drive', fields='files(id)').execute()
-        files = results.get('files', [])
-        
-        if files:
-            images_folder_id = files[0]['id']
+        images_folder_id = find_images_folder_on_drive(service, project_folder_id)
+        if images_folder_id:
+            _drive_existing_files[images_folder_id] = {
+                f['name'] for f in list_files_in_drive_folder(service, images_folder_id, fields='name')
+            }
         else:
             folder_metadata = {
                 'name': 'images',
@@ -117,30 +169,121 @@ def upload_image_to_drive(image_path, project_name, logger):
             }
             folder = service.files().create(body=folder_metadata, fields='id').execute()
             images_folder_id = folder.get('id')
+            remember_folder_on_drive('images', project_folder_id, images_folder_id)
+            _drive_existing_files[images_folder_id] = set()
+        
+        return images_folder_id
+    
+    except Exception as e:
+        logger.log(f"⚠️ Drive アップロード準備エラー（アップロードをスキップします）: {e}")
+        return None
+
+
+def upload_image_to_drive(image_path, images_folder_id, logger):
+    """
+    画像を Google Drive にアップロード（ワーカースレッドから呼ばれる）
+    
+    アップロード済みのファイル名はスキップ
+    """
+    try:
+        from googleapiclient.http import MediaFileUpload
         
-        # 画像ファイルをアップロード
         filename = os.path.basename(image_path)
-        query = f"name='{filename}' and '{images_folder_id}' in parents and trashed=false"
-        results = service.files().list(q=query, spaces='drive', fields='files(id)').execute()
-        existing_files = results.get('files', [])
+        existing_files = _drive_existing_files.setdefault(images_folder_id, set())
+        if filename in existing_files:
+            logger.log(f"⏭️ Drive にアップロード済み: {filename}")
+            return
         
-        if existing_files:
-            file_id = existing_files[0]['id']
-            media = MediaFileUpload(image_path, mimetype='image/png')
-            service.files().update(fileId=file_id, media_body=media).execute()
-        else:
-            file_metadata = {'name': filename, 'parents': [images_folder_id]}
-            media = MediaFileUpload(image_path, mimetype='image/png')
-            service.files().create(body=file_metadata, media_body=media, fields='id').execute()
+        # ワーカースレッドごとのサービスを使う（httplib2 はスレッド間で共有できない）
+        service = get_drive_service()
+        
+        # 画像ファイルをアップロード
+        file_metadata = {'name': filename, 'parents': [images_folder_id]}
+        media = MediaFileUpload(image_path, mimetype='image/png')
+        service.files().create(body=file_metadata, media_body=media, fields='id').execute()
+        existing_files.add(filename)
     
     except Exception as e:
         logger.log(f"⚠️ Drive アップロードエラー（続行します）: {e}")
 
 
-def retrieve_batch_results(batch_id, project_folder, project_name, image_output_dir, logger, tracker):
+async def drive_upload_worker(queue, images_folder_id, logger):
+    """
+    キューから画像パスを取り出して Drive にアップロード（None で終了）
+    """
+    while True:
+        image_path = await queue.get()
+        if image_path is None:
+            break
+        await asyncio.to_thread(upload_image_to_drive, image_path, images_folder_id, logger)
+
+
+def load_model_map(batch_file_path):
+    """
+    バッチリクエストファイルから custom_id -> model の対応を読み込む
+    
+    各行を全体パースせず、正規表現で custom_id と model だけを取り出す
+    （一致しない行のみ JSON としてパース）
+    
+    Returns:
+        dict: {custom_id: model}
+    """
+    model_map = {}
+    with open(batch_file_path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            match = MODEL_MAP_PATTERN.search(line)
+            if match:
+                model_map[match.group(1).decode("utf-8")] = match.group(2).decode("utf-8")
+            else:
+                req = json_loads(line)
+                model_map[req.get("custom_id", "")] = req.get("body", {}).get("model", "")
+    return model_map
+
+
+def decode_and_save_image(b64_data, filepath):
+    """
+    base64 の画像データをデコードして保存（スレッドプールから呼ばれる）
+    
+    B64_DECODE_CHUNK 文字ずつデコードして書き出し、デコード後の画像全体を
+    メモリに載せない。pybase64 があれば SIMD 実装でデコード
+    
+    POSIX 環境ではデコード後のサイズ分を posix_fallocate で先に確保し、
+    ファイルの断片化を抑える（見積もりが実サイズより大きければ最後に切り詰める）
+    """
+    fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    with open(fd, "wb") as f:
+        reserved = 0
+        if FALLOCATE_AVAILABLE:
+            reserved = len(b64_data) * 3 // 4 - b64_data[-2:].count("=")
+            if reserved > 0:
+                try:
+                    os.posix_fallocate(fd, 0, reserved)
+                except OSError:
+                    # 未対応のファイルシステムでは確保せずに書き込む
+                    reserved = 0
+        
+        written = 0
+        for start in range(0, len(b64_data), B64_DECODE_CHUNK):
+            chunk = b64_data[start:start + B64_DECODE_CHUNK]
+            if PYBASE64_AVAILABLE:
+                written += f.write(pybase64.b64decode(chunk, validate=False))
+            else:
+                written += f.write(binascii.a2b_base64(chunk))
+        
+        if reserved > written:
+            f.flush()
+            os.ftruncate(fd, written)
+
+
+async def retrieve_batch_results(batch, project_folder, batch_info, project_name, image_output_dir, logger, tracker):
     """
     バッチ結果を取得して画像を保存
     
+    画像は保存した順にキューへ流し、DRIVE_UPLOAD_CONCURRENCY 個のワーカーが
+    並列に Google Drive へアップロードする
+    
     GPT Image モデルのレスポンス構造:
     {
         "response": {
@@ -156,106 +299,147 @@ def retrieve_batch_results(batch_id, project_folder, project_name, image_output_
         }
     }
     """
-    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-    
-    logger.log(f"\n📥 バッチ結果を取得中: {batch_id}")
-    
-    # バッチ情報を取得
-    batch = client.batches.retrieve(batch_id)
+    # ポーリングで取得済みの batch（completed）をそのまま使う
+    logger.log(f"\n📥 バッチ結果を取得中: {batch.id}")
     
     if not batch.output_file_id:
         logger.log("🚨 出力ファイルIDが見つかりません")
         return 0, 0
     
-    # 結果ファイルをダウンロード
-    logger.log(f"📥 結果ファイルをダウンロード中: {batch.output_file_id}")
-    file_response = client.files.content(batch.output_file_id)
-    
-    # 結果を処理
-    results = []
-    for line in file_response.text.strip().split('\n'):
-        if line.strip():
-            result = json.loads(line)
-            results.append(result)
-    
-    logger.log(f"✅ 取得成功: {len(results)} 件")
-    
-    # バッチリクエストファイルからモデル情報を事前に読み込む
+    # バッチリクエストファイルからモデル情報を事前に読み込む（batch_info は main で読み込み済み）
     model_map = {}  # custom_id -> model
-    batch_info = load_batch_info(project_folder, logger)
-    if batch_info and "batch_file_path" in batch_info:
+    if "batch_file_path" in batch_info:
         batch_file_path = batch_info["batch_file_path"]
         if os.path.exists(batch_file_path):
-            with open(batch_file_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    req = json.loads(line)
-                    custom_id = req.get("custom_id", "")
-                    model = req.get("body", {}).get("model", "")
-                    model_map[custom_id] = model
+            model_map = load_model_map(batch_file_path)
+    
+    # Drive アップロードのワーカーを起動（未設定ならアップロードしない）
+    images_folder_id = prepare_drive_upload(project_name, logger)
+    upload_queue = asyncio.Queue(maxsize=DRIVE_UPLOAD_CONCURRENCY * 2)
+    upload_workers = []
+    if images_folder_id:
+        upload_workers = [
+            asyncio.create_task(drive_upload_worker(upload_queue, images_folder_id, logger))
+            for _ in range(DRIVE_UPLOAD_CONCURRENCY)
+        ]
     
     # 画像を保存
     success_count = 0
     failed_count = 0
     high_quality_count = 0
     mini_count = 0
+    result_count = 0
     
-    for result in results:
-        custom_id = None
+    # 画像のデコードと保存はスレッドプールで並列に行う
+    loop = asyncio.get_running_loop()
+    decode_executor = ThreadPoolExecutor(max_workers=IMAGE_DECODE_WORKERS)
+    pending_saves = asyncio.Semaphore(IMAGE_DECODE_WORKERS * 2)  # デコード待ちの base64 を溜めすぎない
+    save_tasks = []
+    saved_count = 0
+    
+    async def save_image(custom_id, b64_data, filename):
+        """デコード + 保存し、成功したら Drive アップロードのキューに渡す"""
+        nonlocal saved_count
+        filepath = os.path.join(image_output_dir, filename)
         try:
-            custom_id = result["custom_id"]
-            image_num = int(custom_id.split("_")[1])
-            
-            response = result.get("response", {})
-            status_code = response.get("status_code", 0)
+            await loop.run_in_executor(decode_executor, decode_and_save_image, b64_data, filepath)
+        except Exception as e:
+            logger.log(f"⚠️ 画像保存エラー: {custom_id} - {str(e)}")
+            return custom_id, False
+        finally:
+            pending_saves.release()
+        
+        saved_count += 1
+        if saved_count % IMAGE_SAVE_LOG_INTERVAL == 0:
+            logger.log(f"✅ 画像保存: {saved_count} 枚完了（最新: {filename}）")
+        
+        # Google Drive にアップロード（ワーカーに渡す）
+        if upload_workers:
+            await upload_queue.put(filepath)
+        return custom_id, True
+    
+    # 結果ファイルをストリーミングで1行ずつ処理（ファイル全体をメモリに載せない）
+    logger.log(f"📥 結果ファイルをダウンロード中: {batch.output_file_id}")
+    # 非同期クライアントで受信し、受信待ちの間もイベントループ（保存完了→アップロード投入）を止めない
+    # イベントループごとに接続プールが紐づくため、クライアントはこの呼び出しの中で生成・破棄する
+    async with AsyncOpenAI(
+        api_key=os.environ.get("OPENAI_API_KEY"),
+        timeout=BATCH_RETRIEVE_API_TIMEOUT,
+        max_retries=BATCH_RETRIEVE_API_MAX_RETRIES
+    ) as client, client.files.with_streaming_response.content(batch.output_file_id) as file_response:
+        async for line in file_response.iter_lines():
+            if not line.strip():
+                continue
             
-            if status_code == 200:
-                # 画像データを取得（GPT Image モデルのレスポンス構造）
-                body = response.get("body", {})
-                data_list = body.get("data", [])
+            result_count += 1
+            custom_id = None
+            try:
+                result = json_loads(line)
+                custom_id = result["custom_id"]
+                image_num = int(custom_id.split("_")[1])
                 
-                # b64_json を探す
-                b64_data = None
-                if data_list:
-                    # data[0] から b64_json を取得
-                    b64_data = data_list[0].get("b64_json")
+                response = result.get("response", {})
+                status_code = response.get("status_code", 0)
                 
-                if b64_data:
-                    image_data = base64.b64decode(b64_data)
-                    
-                    # ファイル保存
-                    filename = f"{image_num:03d}.png"
-                    filepath = os.path.join(image_output_dir, filename)
-                    
-                    with open(filepath, "wb") as f:
-                        f.write(image_data)
+                if status_code == 200:
+                    # 画像データを取得（GPT Image モデルのレスポンス構造）
+                    body = response.get("body", {})
+                    data_list = body.get("data", [])
                     
-                    logger.log(f"✅ 画像保存: {filename}")
-                    success_count += 1
+                    # b64_json を探す
+                    b64_data = None
+                    if data_list:
+                        # data[0] から b64_json を取得
+                        b64_data = data_list[0].get("b64_json")
                     
-                    # モデル判定（事前に読み込んだマップから取得）
-                    model = model_map.get(custom_id, "")
-                    if model == "gpt-image-1":
-                        high_quality_count += 1
+                    if b64_data:
+                        # デコード + ファイル保存はスレッドプールに渡す
+                        filename = f"{image_num:03d}.png"
+                        await pending_saves.acquire()
+                        save_tasks.append(asyncio.create_task(save_image(custom_id, b64_data, filename)))
+                        await asyncio.sleep(0)  # 保存・アップロードをすぐ開始させる
                     else:
-                        mini_count += 1
-                    
-                    # Google Drive にアップロード
-                    upload_image_to_drive(filepath, project_name, logger)
+                        logger.log(f"⚠️ 画像データなし: {custom_id}")
+                        logger.log(f"   レスポンス: {json.dumps(body, ensure_ascii=False)[:200]}...")
+                        failed_count += 1
                 else:
-                    logger.log(f"⚠️ 画像データなし: {custom_id}")
-                    logger.log(f"   レスポンス: {json.dumps(body, ensure_ascii=False)[:200]}...")
+                    error = response.get("error", {})
+                    error_msg = error.get("message", "不明なエラー")
+                    logger.log(f"⚠️ 失敗: {custom_id} - {error_msg}")
                     failed_count += 1
-            else:
-                error = response.get("error", {})
-                error_msg = error.get("message", "不明なエラー")
-                logger.log(f"⚠️ 失敗: {custom_id} - {error_msg}")
+                    
+            except Exception as e:
+                logger.log(f"⚠️ エラー: {custom_id} - {str(e)}")
+                import traceback
+                logger.log(traceback.format_exc())
                 failed_count += 1
-                
-        except Exception as e:
-            logger.log(f"⚠️ エラー: {custom_id} - {str(e)}")
-            import traceback
-            logger.log(traceback.format_exc())
+    
+    logger.log(f"✅ 取得成功: {result_count} 件")
+    
+    # 画像保存の完了を待って集計
+    save_results = await asyncio.gather(*save_tasks)
+    logger.log(f"✅ 画像保存完了: {saved_count} 枚")
+    for custom_id, saved in save_results:
+        if not saved:
             failed_count += 1
+            continue
+        
+        success_count += 1
+        
+        # モデル判定（事前に読み込んだマップから取得）
+        model = model_map.get(custom_id, "")
+        if model == "gpt-image-1":
+            high_quality_count += 1
+        else:
+            mini_count += 1
+    decode_executor.shutdown()
+    
+    # アップロード完了を待つ
+    if upload_workers:
+        for _ in upload_workers:
+            await upload_queue.put(None)
+        await asyncio.gather(*upload_workers)
+        logger.log(f"☁️ Google Drive へのアップロード完了")
     
     # コスト記録
     tracker.add_phase_2(
@@ -265,19 +449,13 @@ def retrieve_batch_results(batch_id, project_folder, project_name, image_output_
         images_mini=mini_count
     )
     
-    # バッチ情報を更新
-    batch_info_file = os.path.join(project_folder, "gpt_batch_info.json")
-    if os.path.exists(batch_info_file):
-        with open(batch_info_file, "r", encoding="utf-8") as f:
-            batch_info = json.load(f)
-        
-        batch_info["status"] = "completed"
-        batch_info["completed_at"] = datetime.now().isoformat()
-        batch_info["success_count"] = success_count
-        batch_info["failed_count"] = failed_count
-        
-        with open(batch_info_file, "w", encoding="utf-8") as f:
-            json.dump(batch_info, f, ensure_ascii=False, indent=2)
+    # バッチ情報を更新（読み直さず、受け取った dict を更新して1回だけ書き込む）
+    batch_info["status"] = "completed"
+    batch_info["completed_at"] = datetime.now().isoformat()
+    batch_info["success_count"] = success_count
+    batch_info["failed_count"] = failed_count
+    
+    write_json_atomic(os.path.join(project_folder, "gpt_batch_info.json"), batch_info)
     
     return success_count, failed_count
 
@@ -323,46 +501,61 @@ def main():
         # ステータス確認ループ
         start_time = time.time()
         check_count = 0
+        poll_count = 0  # バックオフ用（validating → in_progress で初期間隔に戻す）
+        previous_status = None
         
         while True:
             check_count += 1
-            logger.log(f"\n🔄 ステータス確認 #{check_count}")
+            poll_count += 1
             
-            batch = check_batch_status(batch_id, logger)
+            try:
+                batch = check_batch_status(batch_id)
+            except (APIConnectionError, APIStatusError) as e:
+                # SDK のリトライでも回復しなかった一時的なエラーは、Retry-After を尊重して次回に持ち越す
+                if not is_retryable_api_error(e) or time.time() - start_time > BATCH_MAX_WAIT_TIME:
+                    raise
+                wait_seconds = max(retry_after_seconds(e) or 0.0, next_poll_interval(poll_count))
+                logger.log(f"⚠️ ステータス確認エラー（{wait_seconds:.0f}秒後に再試行）: {e}")
+                time.sleep(wait_seconds)
+                continue
             status = batch.status
+            elapsed = time.time() - start_time
             
-            logger.log(f"  ステータス: {status}")
+            if previous_status == "validating" and status == "in_progress":
+                poll_count = 1
+            previous_status = status
             
             if status == "completed":
+                logger.log(f"🔄 #{check_count} [{elapsed/60:.1f}分経過] ステータス: {status}{format_progress(batch)}")
                 logger.log("\n✅ バッチ処理完了!")
                 break
             elif status in ["failed", "expired", "cancelled"]:
+                logger.log(f"🔄 #{check_count} [{elapsed/60:.1f}分経過] ステータス: {status}{format_progress(batch)}")
                 logger.log(f"\n❌ バッチ失敗: {status}")
                 if hasattr(batch, 'errors') and batch.errors:
                     logger.log(f"  エラー詳細: {batch.errors}")
                 logger.save_on_error()
                 sys.exit(1)
-            elif status == "in_progress":
-                # 進捗表示
-                pass
             
             # タイムアウトチェック
-            elapsed = time.time() - start_time
             if elapsed > BATCH_MAX_WAIT_TIME:
                 logger.log(f"\n❌ タイムアウト ({BATCH_MAX_WAIT_TIME}秒)")
                 logger.save_on_error()
                 sys.exit(1)
             
-            # 待機
+            # 待機（1回の確認につきログは1行にまとめる）
             remaining = BATCH_MAX_WAIT_TIME - elapsed
-            logger.log(f"  次回チェックまで {BATCH_CHECK_INTERVAL}秒待機...")
-            logger.log(f"  残り時間: {remaining/60:.1f}分")
-            time.sleep(BATCH_CHECK_INTERVAL)
+            wait_seconds = next_poll_interval(poll_count)
+            logger.log(
+                f"🔄 #{check_count} [{elapsed/60:.1f}分経過 / 残り{remaining/60:.1f}分] "
+                f"ステータス: {status}{format_progress(batch)} / 次回 {wait_seconds:.0f}秒後"
+            )
+            time.sleep(wait_seconds)
         
         # 結果取得
-        success_count, failed_count = retrieve_batch_results(
-            batch_id, output_dir, project_name, image_output_dir, logger, tracker
-        )
+        success_count, failed_count = asyncio.run(retrieve_batch_results(
+            batch, output_dir, batch_info, project_name, image_output_dir, logger, tracker
+        ))
         
         # コストサマリー
         logger.log(f"\n{tracker.get_detailed_summary()}")
@@ -12,8 +12,7 @@ prompts_data.jsonl から image_prompt を読み込み、OpenAI Batch API で送
 """
 import os
 import sys
-import json
-import glob
+import traceback
 from datetime import datetime
 from dotenv import load_dotenv
 from openai import OpenAI
@@ -22,12 +21,15 @@ from openai import OpenAI
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from logger_utils import DualLogger
+from json_utils import json_dumps_bytes, json_loads, write_json_atomic
 from project_utils import read_project_info, get_output_dir, ensure_image_output_dir
 from config import (
     LOGS_DIR, GPT_IMAGE_MODEL, IMAGE_SIZE, IMAGE_QUALITY,
-    TEST_MODE_LIMIT
+    TEST_MODE_LIMIT, BATCH_STATUS_SAVE_MAX_ATTEMPTS
+)
+from gdrive_checkpoint import (
+    check_drive_checkpoint, find_project_folder_on_drive, get_drive_service
 )
-from gdrive_checkpoint import check_drive_checkpoint, authenticate_gdrive, find_project_folder_on_drive
 
 load_dotenv()
 
@@ -62,19 +64,15 @@ def download_prompts_from_drive(project_name, output_file_path, logger):
     """
     try:
         from googleapiclient.http import MediaIoBaseDownload
-        from googleapiclient.discovery import build
-        import io
         
         parent_folder_id = os.getenv("GDRIVE_PARENT_FOLDER_ID")
         if not parent_folder_id:
             return False
         
-        creds = authenticate_gdrive()
-        if not creds:
+        service = get_drive_service()
+        if not service:
             return False
         
-        service = build('drive', 'v3', credentials=creds)
-        
         project_folder_id = find_project_folder_on_drive(service, project_name, parent_folder_id)
         if not project_folder_id:
             return False
@@ -89,16 +87,16 @@ def download_prompts_from_drive(project_name, output_file_path, logger):
         
         file_id = files[0]['id']
         request = service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
         
+        # チャンクごとに一時ファイルへ直接書き出し、完了後に置き換える（全体をメモリに載せない）
         os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
-        with open(output_file_path, 'wb') as f:
-            f.write(fh.getvalue())
+        tmp_path = f"{output_file_path}.tmp"
+        with open(tmp_path, 'wb') as fh:
+            downloader = MediaIoBaseDownload(fh, request)
+            done = False
+            while not done:
+                status, done = downloader.next_chunk()
+        os.replace(tmp_path, output_file_path)
         
         logger.log(f"☁️  Drive から prompts_data.jsonl をダウンロードしました")
         return True
@@ -120,19 +118,19 @@ def load_prompts_from_jsonl(prompts_file_path, logger):
     
     try:
         prompts = []
-        with open(prompts_file_path, "r", encoding="utf-8") as f:
+        with open(prompts_file_path, "rb") as f:
             for line_num, line in enumerate(f, 1):
                 line = line.strip()
                 if not line:
                     continue
                 
                 try:
-                    data = json.loads(line)
+                    data = json_loads(line)
                     if "index" not in data or "image_prompt" not in data:
                         logger.log(f"⚠️ 行{line_num}: 必須フィールドがありません。スキップします。")
                         continue
                     prompts.append(data)
-                except json.JSONDecodeError as e:
+                except ValueError as e:
                     logger.log(f"⚠️ 行{line_num}: JSON解析エラー: {e}")
                     continue
         
@@ -152,8 +150,8 @@ def check_existing_images(image_output_dir, project_name, logger):
     
     if os.path.exists(image_output_dir):
         try:
-            local_images = glob.glob(os.path.join(image_output_dir, "*.png"))
-            existing_images = set([os.path.basename(f) for f in local_images])
+            with os.scandir(image_output_dir) as entries:
+                existing_images = {entry.name for entry in entries if entry.name.endswith(".png")}
             
             if existing_images:
                 logger.log(f"🔄 ローカルチェックポイント検出: {len(existing_images)} 枚の画像が既に生成済み")
@@ -188,38 +186,35 @@ def create_batch_file(prompts_to_process, total_count, project_folder, logger):
     Returns:
         str: バッチファイルのパス
     """
-    batch_requests = []
-    
-    for prompt_data in prompts_to_process:
-        image_index = prompt_data["index"]
-        image_prompt = prompt_data["image_prompt"]
-        
-        # モデル選択
-        model, price = select_model_for_image(image_index, total_count)
-        
-        request = {
-            "custom_id": f"image_{image_index:03d}",
-            "method": "POST",
-            "url": "/v1/images/generations",
-            "body": {
-                "model": model,
-                "prompt": image_prompt,
-                "size": IMAGE_SIZE,
-                "quality": IMAGE_QUALITY,
-                "output_format": "png"  # GPT Image モデルは response_format ではなく output_format を使用
-            }
-        }
-        batch_requests.append(request)
-        logger.log(f"  📝 画像 {image_index}: {model} (${price}/枚)")
-    
-    # JSONLファイルを作成
+    # 1件ずつシリアライズしてそのまま書き出す（リクエスト全体をメモリに溜めない）
     batch_file_path = os.path.join(project_folder, "gpt_batch_requests.jsonl")
-    with open(batch_file_path, "w", encoding="utf-8") as f:
-        for req in batch_requests:
-            f.write(json.dumps(req, ensure_ascii=False) + "\n")
+    request_count = 0
+    with open(batch_file_path, "wb") as f:
+        for prompt_data in prompts_to_process:
+            image_index = prompt_data["index"]
+            image_prompt = prompt_data["image_prompt"]
+            
+            # モデル選択
+            model, price = select_model_for_image(image_index, total_count)
+            
+            request = {
+                "custom_id": f"image_{image_index:03d}",
+                "method": "POST",
+                "url": "/v1/images/generations",
+                "body": {
+                    "model": model,
+                    "prompt": image_prompt,
+                    "size": IMAGE_SIZE,
+                    "quality": IMAGE_QUALITY,
+                    "output_format": "png"  # GPT Image モデルは response_format ではなく output_format を使用
+                }
+            }
+            f.write(json_dumps_bytes(request) + b"\n")
+            request_count += 1
+            logger.log(f"  📝 画像 {image_index}: {model} (${price}/枚)")
     
     logger.log(f"\n✅ バッチファイル作成: {batch_file_path}")
-    logger.log(f"   リクエスト数: {len(batch_requests)} 件")
+    logger.log(f"   リクエスト数: {request_count} 件")
     
     return batch_file_path
 
@@ -262,8 +257,7 @@ def submit_batch_job(batch_file_path, project_folder, logger):
     }
     
     batch_info_file = os.path.join(project_folder, "gpt_batch_info.json")
-    with open(batch_info_file, "w", encoding="utf-8") as f:
-        json.dump(batch_info, f, ensure_ascii=False, indent=2)
+    write_json_atomic(batch_info_file, batch_info)
     
     logger.log(f"✅ バッチ情報を保存: {batch_info_file}")
     
@@ -324,12 +318,15 @@ def main():
             logger.log(f"▶️  Phase 2 をスキップします")
             sys.exit(0)
         
-        # 未完了分をフィルタリング
-        prompts_to_process = []
-        for prompt_data in prompt_data_list:
-            filename = f"{prompt_data['index']:03d}.png"
-            if filename not in existing_images:
-                prompts_to_process.append(prompt_data)
+        # 未完了分をフィルタリング（ファイル名ではなく番号で照合）
+        existing_indices = {
+            int(name[:-4]) for name in existing_images
+            if name.endswith(".png") and name[:-4].isdigit()
+        }
+        prompts_to_process = [
+            prompt_data for prompt_data in prompt_data_list
+            if prompt_data["index"] not in existing_indices
+        ]
         
         # テストモード対応
         if TEST_MODE_LIMIT > 0:
@@ -394,39 +391,52 @@ def main():
         
         # GCS にも登録（Cloud Run 用）
         try:
-            from google.cloud import storage
-            import json
+            from gcs_utils import get_gcs_client
+            from google.api_core.exceptions import NotFound, PreconditionFailed
             
             gcs_bucket = os.environ.get("GCS_BUCKET_NAME")
             if gcs_bucket:
-                client = storage.Client()
+                client = get_gcs_client()
                 bucket = client.bucket(gcs_bucket)
-                blob = bucket.blob("batch_status.json")
                 
-                # 既存の状態を読み込み
-                if blob.exists():
-                    content = blob.download_as_text()
-                    status_data = json.loads(content)
+                # 読み込み時の generation を条件に保存し、他のジョブが先に更新していた場合は読み直して再適用
+                for attempt in range(1, BATCH_STATUS_SAVE_MAX_ATTEMPTS + 1):
+                    # Blob は読み書きした generation に固定されるため、試行ごとに作り直す
+                    blob = bucket.blob("batch_status.json")
+                    
+                    # 既存の状態を読み込み（存在確認はせず、GET 1回で NotFound を判定）
+                    try:
+                        status_data = json_loads(blob.download_as_bytes())
+                        generation = blob.generation
+                    except NotFound:
+                        status_data = {"projects": {}}
+                        generation = 0  # 0: まだ存在しない場合のみ作成
+                    
+                    # プロジェクトを追加
+                    status_data.setdefault("projects", {})[project_name] = {
+                        "batch_id": batch_id,
+                        "batch_type": "gpt_images",
+                        "status": "in_progress",
+                        "submitted_at": datetime.now().isoformat(),
+                        "output_dir": output_dir,
+                        "model_name": model_name
+                    }
+                    
+                    # 保存
+                    try:
+                        blob.upload_from_string(
+                            json_dumps_bytes(status_data, indent=True),
+                            content_type="application/json",
+                            if_generation_match=generation
+                        )
+                    except PreconditionFailed:
+                        logger.log(f"⚠️ batch_status.json が他のジョブに更新されていました。再試行します ({attempt}/{BATCH_STATUS_SAVE_MAX_ATTEMPTS})")
+                        continue
+                    
+                    logger.log(f"☁️  GCS (Cloud Run用) に登録しました")
+                    break
                 else:
-                    status_data = {"projects": {}}
-                
-                # プロジェクトを追加
-                from datetime import datetime
-                status_data["projects"][project_name] = {
-                    "batch_id": batch_id,
-                    "batch_type": "gpt_images",
-                    "status": "in_progress",
-                    "submitted_at": datetime.now().isoformat(),
-                    "output_dir": output_dir,
-                    "model_name": model_name
-                }
-                
-                # 保存
-                blob.upload_from_string(
-                    json.dumps(status_data, ensure_ascii=False, indent=2),
-                    content_type="application/json"
-                )
-                logger.log(f"☁️  GCS (Cloud Run用) に登録しました")
+                    logger.log(f"\n⚠️ GCS 登録エラー（続行）: 競合が {BATCH_STATUS_SAVE_MAX_ATTEMPTS} 回続きました")
         except ImportError:
             logger.log(f"\n⚠️ google-cloud-storage がインストールされていません")
         except Exception as e:
@@ -436,7 +446,6 @@ def main():
         
     except Exception as e:
         logger.log(f"❌ エラー: {str(e)}")
-        import traceback
         logger.log(traceback.format_exc())
         logger.save_on_error()
         return False
@@ -5,6 +5,25 @@ Claudeのレスポンスから画像プロンプトを確実に抽出
 import xml.etree.ElementTree as ET
 import re
 
+# google-re2 をインポート（存在する場合のみ。線形時間の DFA で、長い応答でもバックトラックしない）
+try:
+    import re2
+    RE2_AVAILABLE = True
+except ImportError:
+    RE2_AVAILABLE = False
+
+_regex = re2 if RE2_AVAILABLE else re
+
+# <image_prompt> 抽出用の正規表現（モジュール読み込み時に1回だけコンパイル）
+# re / re2 の両方で使えるよう、フラグはインライン (?s) で指定し、先読みは使わない
+IMAGE_PROMPT_PATTERN = _regex.compile(r'(?s)<image_prompt>\s*(.*?)\s*</image_prompt>')
+IMAGE_PROMPT_PARTIAL_PATTERN = _regex.compile(r'(?s)<image_prompt>\s*(.*?)(?:\n\n|$)')
+OUTPUT_TAG_PATTERN = _regex.compile(r'(?s)<output>\s*(.*?)\s*(?:</output>|$)')
+IMAGE_PROMPT_TAG_PATTERN = _regex.compile(r'</?image_prompt>')
+
+# 画像プロンプトとして妥当かを判定するキーワード（大文字小文字を区別せず1回の走査で検索）
+PROMPT_KEYWORD_PATTERN = _regex.compile(r'(?i)shot|angle|style|scene|character|background')
+
 
 def parse_xml_response(response_text, logger):
     """
@@ -45,14 +64,14 @@ def extract_prompt_with_regex(text, logger):
         str: 抽出されたプロンプト、失敗時は None
     """
     # パターン1: 完全なXMLタグ（通常ケース）
-    match = re.search(r'<image_prompt>\s*(.*?)\s*</image_prompt>', text, re.DOTALL)
+    match = IMAGE_PROMPT_PATTERN.search(text)
     if match:
         prompt = match.group(1).strip()
         logger.log(f"✅ プロンプト抽出成功（{len(prompt)}文字、完全なXML）")
         return prompt
     
     # パターン2: 閉じタグが無い（途中で切れた）
-    match = re.search(r'<image_prompt>\s*(.*?)(?=\n\n|$)', text, re.DOTALL)
+    match = IMAGE_PROMPT_PARTIAL_PATTERN.search(text)
     if match:
         prompt = match.group(1).strip()
         logger.log(f"⚠️ プロンプト抽出成功（{len(prompt)}文字、途中で切断）")
@@ -60,11 +79,11 @@ def extract_prompt_with_regex(text, logger):
     
     # パターン3: タグ無し（生テキスト）
     # output タグだけある場合
-    match = re.search(r'<output>\s*(.*?)\s*(?:</output>|$)', text, re.DOTALL)
+    match = OUTPUT_TAG_PATTERN.search(text)
     if match:
         content = match.group(1).strip()
         # image_prompt タグを除去
-        content = re.sub(r'</?image_prompt>', '', content).strip()
+        content = IMAGE_PROMPT_TAG_PATTERN.sub('', content).strip()
         if content:
             logger.log(f"⚠️ プロンプト抽出成功（{len(content)}文字、outputタグのみ）")
             return content
@@ -96,10 +115,7 @@ def validate_prompt_quality(prompt, min_length=100, max_length=2000):
         return False, f"プロンプトが長すぎます（{prompt_length}文字 > {max_length}文字）"
     
     # 基本的なキーワードチェック（画像プロンプトとして妥当か）
-    keywords = ['shot', 'angle', 'style', 'scene', 'character', 'background']
-    has_keywords = any(keyword in prompt.lower() for keyword in keywords)
-    
-    if not has_keywords:
+    if PROMPT_KEYWORD_PATTERN.search(prompt) is None:
         return False, "画像プロンプトとして不適切な内容です"
     
     return True, "OK"
\ No newline at end of file
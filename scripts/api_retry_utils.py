@@ -1,45 +1,363 @@
 """
 API呼び出しのリトライ機能を提供するユーティリティ
 """
+import asyncio
+import hashlib
+import random
+import re
+import threading
 import time
-from typing import Callable, Any, Optional
+import uuid
+import weakref
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from contextlib import asynccontextmanager, contextmanager
+from typing import Awaitable, Callable, Any, Optional
+from circuit_breaker import CircuitOpenError, get_breaker
+from config import (
+    API_ATTEMPT_TIMEOUT, PROVIDER_POOLS, BATCH_MIN_POLL_INTERVAL, BATCH_MAX_POLL_INTERVAL
+)
 
 # OpenAI のエラー型をインポート（存在する場合のみ）
 try:
-    from openai import BadRequestError, RateLimitError, APIConnectionError, AuthenticationError
+    from openai import (
+        BadRequestError, RateLimitError, APIConnectionError, AuthenticationError,
+        PermissionDeniedError, InternalServerError
+    )
     OPENAI_AVAILABLE = True
 except ImportError:
     OPENAI_AVAILABLE = False
 
 # Anthropic のエラー型をインポート（存在する場合のみ）
 try:
-    from anthropic import BadRequestError as AnthropicBadRequestError, RateLimitError as AnthropicRateLimitError
+    from anthropic import (
+        BadRequestError as AnthropicBadRequestError,
+        RateLimitError as AnthropicRateLimitError,
+        APIConnectionError as AnthropicAPIConnectionError,
+        AuthenticationError as AnthropicAuthenticationError,
+        PermissionDeniedError as AnthropicPermissionDeniedError,
+        InternalServerError as AnthropicInternalServerError
+    )
     ANTHROPIC_AVAILABLE = True
 except ImportError:
     ANTHROPIC_AVAILABLE = False
 
+# 例外の型だけでリトライ可否が決まるもの（文字列での判定より先に isinstance で判定する）
+_NON_RETRYABLE_EXC = ()
+_RETRYABLE_EXC = ()
+# レート制限（サーキットブレーカーの失敗には数えず、Retry-After に従って待つ）
+_RATE_LIMIT_EXC = ()
+if OPENAI_AVAILABLE:
+    _NON_RETRYABLE_EXC += (AuthenticationError, PermissionDeniedError, BadRequestError)
+    _RETRYABLE_EXC += (RateLimitError, APIConnectionError, InternalServerError)
+    _RATE_LIMIT_EXC += (RateLimitError,)
+if ANTHROPIC_AVAILABLE:
+    _NON_RETRYABLE_EXC += (AnthropicAuthenticationError, AnthropicPermissionDeniedError, AnthropicBadRequestError)
+    _RETRYABLE_EXC += (AnthropicRateLimitError, AnthropicAPIConnectionError, AnthropicInternalServerError)
+    _RATE_LIMIT_EXC += (AnthropicRateLimitError,)
+
+# HTTP ステータスコードでリトライ可能と判定するもの
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# エラーメッセージのキーワード（大文字小文字を無視して1回の走査で判定する）
+MODERATION_ERROR_PATTERN = re.compile(r"content_policy|moderation", re.IGNORECASE)
+CREDIT_ERROR_PATTERN = re.compile(r"credit|billing", re.IGNORECASE)
+NON_RETRYABLE_ERROR_PATTERN = re.compile(
+    r"content_policy|moderation|credit|billing|invalid_api_key|authentication",
+    re.IGNORECASE
+)
+RETRYABLE_ERROR_PATTERN = re.compile(
+    r"timeout|connection|network"
+    r"|\b50[023]\b"  # Internal Server Error / Bad Gateway / Service Unavailable
+    r"|\b429\b",     # Rate Limit
+    re.IGNORECASE
+)
+
+# 再試行で同じ書き込み系リクエストが二重に実行されないよう、プロバイダーに送るヘッダー
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+# 実行ごとの識別子（別の実行で同じ処理をやり直した場合はキーが変わるようにする）
+_RUN_ID = uuid.uuid4().hex
+
+# 並列ワーカー間で待機時間が揃わないよう、OS の乱数源から独立にサンプリングする
+_jitter_rng = random.SystemRandom()
+
+# half-open の試験呼び出しの結果を待つ間隔（秒）
+_HALF_OPEN_POLL_SECONDS = 1.0
+
+# プロバイダー別のバルクヘッド（同期版はスレッド間、非同期版はタスク間で同時実行数を制限する）
+PROVIDER_SEMAPHORES = {provider: threading.BoundedSemaphore(size) for provider, size in PROVIDER_POOLS.items()}
+# 非同期版はイベントループごとに生成する（asyncio.run のたびにループが変わるため）
+_provider_async_semaphores = weakref.WeakKeyDictionary()  # ループ -> {プロバイダー: Semaphore}
+
+
+def make_idempotency_key(*parts) -> str:
+    """
+    論理的に同じリクエストに対して、この実行中は常に同じ Idempotency-Key を生成する
+    
+    call_api_with_retry（と SDK 内部）の再試行では同じキーが送られるため、サーバー側で成功したのに
+    応答が失われた場合でも、対応するプロバイダーでは重複実行（二重課金）として扱われない。
+    別の応答が欲しい再呼び出し（パース失敗時の呼び直し等）は parts に試行番号を含めること
+    
+    Example:
+        >>> extra_headers={IDEMPOTENCY_HEADER: make_idempotency_key(project_name, "phase2", index)}
+    """
+    key_source = ":".join([_RUN_ID, *map(str, parts)])
+    return hashlib.blake2b(key_source.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """
+    例外に付いているレスポンスの Retry-After ヘッダーを秒数で取得
+    
+    openai / anthropic の APIStatusError（RateLimitError 等）、requests / httpx の
+    HTTPError はいずれも .response.headers を持つ。値は秒数と HTTP-date の両方に対応
+    
+    Returns:
+        float: 待機秒数（ヘッダーが無い・解釈できない場合は None）
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def next_poll_interval(poll_count: int) -> float:
+    """
+    指数バックオフ + ジッターで次回ポーリングまでの秒数を計算（バッチ結果取得ループ用）
+    
+    5秒, 10秒, 20秒, ... と倍増し、BATCH_MAX_POLL_INTERVAL で頭打ち（±20% の揺らぎ付き）
+    """
+    interval = min(BATCH_MIN_POLL_INTERVAL * (2 ** min(poll_count - 1, 6)), BATCH_MAX_POLL_INTERVAL)
+    return interval * _jitter_rng.uniform(0.8, 1.2)
+
+
+def is_retryable_api_error(error: Exception) -> bool:
+    """
+    ステータス確認のポーリングを続行してよい一時的なエラーか（接続エラー・429・5xx）
+    
+    ステータスコードを持たない例外（接続エラー・タイムアウト）は一時的なものとして扱う
+    """
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        return True
+    return status_code == 429 or status_code >= 500
+
+
+def _log_pool_saturated(provider, logger):
+    """プロバイダーの同時実行枠が埋まっていることをログ出力（PROVIDER_POOLS の調整用）"""
+    message = f"📊 {provider} の同時実行枠（{PROVIDER_POOLS[provider]}）が埋まっています。空きを待ちます"
+    if logger:
+        logger.log(message)
+    else:
+        print(message)
+
+
+@contextmanager
+def _provider_slot(provider, logger):
+    """プロバイダーの同時実行枠を1つ確保する（PROVIDER_POOLS に無いプロバイダーは制限なし）"""
+    semaphore = PROVIDER_SEMAPHORES.get(provider)
+    if semaphore is None:
+        yield
+        return
+    
+    if not semaphore.acquire(blocking=False):
+        _log_pool_saturated(provider, logger)
+        semaphore.acquire()
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def _get_provider_async_semaphore(provider):
+    """実行中のイベントループ用のプロバイダーの Semaphore を取得（ループごとに初回のみ生成）"""
+    if provider not in PROVIDER_POOLS:
+        return None
+    
+    semaphores = _provider_async_semaphores.setdefault(asyncio.get_running_loop(), {})
+    semaphore = semaphores.get(provider)
+    if semaphore is None:
+        semaphore = semaphores[provider] = asyncio.Semaphore(PROVIDER_POOLS[provider])
+    return semaphore
+
+
+@asynccontextmanager
+async def _provider_slot_async(provider, logger):
+    """_provider_slot の非同期版"""
+    semaphore = _get_provider_async_semaphore(provider)
+    if semaphore is None:
+        yield
+        return
+    
+    if semaphore.locked():
+        _log_pool_saturated(provider, logger)
+    async with semaphore:
+        yield
+
+
+def _circuit_wait_seconds(breaker, provider, retry, logger, operation_name, last_exception):
+    """
+    サーキットが開いている場合に、呼び出しを待つ秒数を返す（通してよい場合は None）
+    
+    最初の呼び出しはリトライ枠を使わずに即座に失敗させ、既にリトライ中の呼び出しは
+    open が解除されるまで待ってから再試行する
+    """
+    if not breaker or breaker.allow():
+        return None
+    
+    remaining = breaker.remaining_open_seconds()
+    if retry == 0:
+        if logger:
+            logger.log(f"⛔ {provider} のサーキットが開いています: {operation_name}をスキップします（残り{remaining:.0f}秒）")
+        raise CircuitOpenError(f"{provider} のサーキットが開いています") from last_exception
+    
+    wait_time = max(remaining, _HALF_OPEN_POLL_SECONDS)
+    if logger:
+        logger.log(f"⛔ {provider} のサーキットが開いています: {operation_name}の再試行を{wait_time:.0f}秒待ちます")
+    return wait_time
+
+
+def _is_provider_outage(error):
+    """
+    サーキットブレーカーの失敗として数えるエラーか（接続エラー・タイムアウト・5xx）
+    
+    429 はプロバイダーが応答しているので数えず、Retry-After に従って待つ
+    """
+    if isinstance(error, _RATE_LIMIT_EXC) or getattr(error, "status_code", None) == 429:
+        return False
+    return is_retryable_error(error)
+
+
+def _handle_api_error(e, retry, max_retries, base_delay, max_delay, logger, operation_name, breaker, provider):
+    """
+    API呼び出しの失敗を処理し、次のリトライまでの待機時間（秒）を返す
+    
+    リトライしないエラー・最後のリトライの失敗の場合は、処理中の例外をそのまま送出する
+    （except 節の中から呼ぶこと）
+    """
+    # モデレーション・クレジット不足はエラー型では区別できないため、メッセージで判定する
+    error_text = str(e)
+    
+    # モデレーションエラーはリトライしない
+    if MODERATION_ERROR_PATTERN.search(error_text):
+        # プロバイダーは応答しているので障害としては数えない
+        if breaker:
+            breaker.record_success()
+        if logger:
+            logger.log(f"🚫 モデレーションエラー: {operation_name}をスキップします")
+        raise
+    
+    if breaker:
+        if not _is_provider_outage(e):
+            # レート制限・リクエスト側のエラーはプロバイダーが応答しているので障害としては数えない
+            breaker.record_success()
+        elif breaker.record_failure() and logger:
+            logger.log(f"⛔ {provider} で失敗が続いたためサーキットを開きます（{breaker.open_seconds}秒間）")
+    
+    # クレジット不足エラーもリトライしない
+    if CREDIT_ERROR_PATTERN.search(error_text):
+        if logger:
+            logger.log(f"💳 クレジット不足エラー: {operation_name}を中断します")
+        raise
+    
+    # 認証エラー・不正なリクエスト等はリトライしても結果が変わらない
+    if not is_retryable_error(e):
+        if logger:
+            logger.log(f"🚫 リトライできないエラー: {operation_name}を中断します: {e}")
+        raise
+    
+    # 最後のリトライも失敗
+    if retry >= max_retries - 1:
+        if logger:
+            logger.log(f"🚨 {operation_name}が{max_retries}回のリトライ後も失敗しました")
+            logger.log(f"最終エラー: {e}")
+        raise
+    
+    # 指数バックオフ + フルジッター: 0 〜 min(上限, 5秒, 10秒, 20秒...) から一様にサンプリング
+    wait_time = _jitter_rng.uniform(0, min(max_delay, base_delay * (2 ** retry)))
+    
+    # サーバーが Retry-After で再開時刻を指示している場合はそれより早く再試行しない
+    server_hint = retry_after_seconds(e)
+    if server_hint is not None:
+        wait_time = max(server_hint, wait_time)
+    
+    if logger:
+        logger.log(f"⚠️ {operation_name}でエラー: {e}")
+        logger.log(f"🔄 {wait_time:.1f}秒後にリトライします（{retry + 1}/{max_retries}回目）")
+    else:
+        print(f"⚠️ リトライ {retry + 1}/{max_retries}: {e}")
+    
+    return wait_time
+
+
+def _wait_within_deadline(wait_time, deadline, operation_name, last_exception):
+    """
+    deadline（time.monotonic() 基準の秒）までに収まる待機時間を返す
+    
+    待機後に再試行する余地が無い場合は、待たずに TimeoutError を送出する
+    """
+    if deadline is None:
+        return wait_time
+    
+    remaining = deadline - time.monotonic()
+    if remaining <= wait_time:
+        raise TimeoutError(f"{operation_name}: フェーズの期限までに再試行できないためリトライを中止します") from last_exception
+    return wait_time
+
 
 def call_api_with_retry(
     api_call: Callable,
     max_retries: int = 3,
     base_delay: int = 5,
+    max_delay: int = 60,
     logger: Optional[Any] = None,
-    operation_name: str = "API呼び出し"
+    operation_name: str = "API呼び出し",
+    provider: Optional[str] = None,
+    deadline: Optional[float] = None
 ) -> Any:
     """
     API呼び出しを自動リトライする
     
+    1回の呼び出しのタイムアウトはクライアント側（httpx.Timeout(API_ATTEMPT_TIMEOUT, ...)）で設定する。
+    タイムアウトした呼び出しは SDK の例外としてリトライ対象になる
+    
     Args:
         api_call: 実行する関数（引数なしのlambda推奨）
         max_retries: 最大リトライ回数（デフォルト: 3回）
-        base_delay: 基本待機時間（秒）。リトライごとに増加
+        base_delay: 基本待機時間（秒）。リトライごとに2倍ずつ増加（指数バックオフ）
+        max_delay: 待機時間の上限（秒）（デフォルト: 60秒）
         logger: ロガーインスタンス（オプション）
         operation_name: 操作名（ログ用）
+        provider: プロバイダー名（"claude" / "openai" 等）。指定するとプロバイダー単位の
+            サーキットブレーカーを通し、障害中は呼び出さずに即座に失敗する（リトライ中は解除を待つ）。
+            同時実行数は PROVIDER_POOLS の枠内に制限される
+        deadline: リトライを打ち切る時刻（time.monotonic() 基準の秒）。次の再試行が
+            この時刻までに始められない場合は待たずに TimeoutError を送出する（None で無制限）
     
     Returns:
         API呼び出しの結果
     
     Raises:
+        CircuitOpenError: 最初の呼び出しの時点でプロバイダーのサーキットが開いている場合
+            （リトライ中に開いた場合は解除されるまで待つ）
+        TimeoutError: deadline までに再試行できない場合
         Exception: 最大リトライ回数を超えた場合
     
     Example:
@@ -49,11 +367,21 @@ def call_api_with_retry(
         ... )
     """
     last_exception = None
+    breaker = get_breaker(provider) if provider else None
     
     for retry in range(max_retries):
+        circuit_wait = _circuit_wait_seconds(breaker, provider, retry, logger, operation_name, last_exception)
+        while circuit_wait is not None:
+            time.sleep(_wait_within_deadline(circuit_wait, deadline, operation_name, last_exception))
+            circuit_wait = _circuit_wait_seconds(breaker, provider, retry, logger, operation_name, last_exception)
+        
         try:
-            # API呼び出しを実行
-            result = api_call()
+            # API呼び出しを実行（プロバイダーの同時実行枠の範囲内で）
+            with _provider_slot(provider, logger):
+                result = api_call()
+            
+            if breaker:
+                breaker.record_success()
             
             # 成功した場合、リトライ情報をログ出力
             if retry > 0 and logger:
@@ -63,36 +391,77 @@ def call_api_with_retry(
             
         except Exception as e:
             last_exception = e
+            wait_time = _handle_api_error(
+                e, retry, max_retries, base_delay, max_delay, logger, operation_name, breaker, provider
+            )
+        
+        time.sleep(_wait_within_deadline(wait_time, deadline, operation_name, last_exception))
+    
+    # ここには到達しないはずだが、念のため
+    if last_exception:
+        raise last_exception
+
+
+async def call_api_with_retry_async(
+    api_call: Callable[[], Awaitable[Any]],
+    max_retries: int = 3,
+    base_delay: int = 5,
+    max_delay: int = 60,
+    logger: Optional[Any] = None,
+    operation_name: str = "API呼び出し",
+    provider: Optional[str] = None,
+    per_attempt_timeout: Optional[float] = API_ATTEMPT_TIMEOUT,
+    deadline: Optional[float] = None
+) -> Any:
+    """
+    call_api_with_retry の非同期版（AsyncOpenAI / AsyncAnthropic 用）
+    
+    待機は asyncio.sleep で行うため、リトライ待ちの間も他のタスクは進む。
+    per_attempt_timeout 以外の引数・例外は call_api_with_retry と同じ
+    
+    Args:
+        per_attempt_timeout: 1回の呼び出しのタイムアウト（秒）。超えた場合はリトライ対象の
+            エラーとして扱う（None で無制限）
+    
+    Example:
+        >>> response = await call_api_with_retry_async(
+        ...     lambda: async_client.images.generate(model="gpt-image-1", ...),
+        ...     logger=logger
+        ... )
+    """
+    last_exception = None
+    breaker = get_breaker(provider) if provider else None
+    
+    for retry in range(max_retries):
+        circuit_wait = _circuit_wait_seconds(breaker, provider, retry, logger, operation_name, last_exception)
+        while circuit_wait is not None:
+            await asyncio.sleep(_wait_within_deadline(circuit_wait, deadline, operation_name, last_exception))
+            circuit_wait = _circuit_wait_seconds(breaker, provider, retry, logger, operation_name, last_exception)
+        
+        try:
+            # API呼び出しを実行（プロバイダーの同時実行枠の範囲内で）
+            async with _provider_slot_async(provider, logger):
+                try:
+                    result = await asyncio.wait_for(api_call(), timeout=per_attempt_timeout)
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"{operation_name}が{per_attempt_timeout:g}秒以内に応答しませんでした") from None
             
-            # モデレーションエラーはリトライしない
-            if "content_policy" in str(e).lower() or "moderation" in str(e).lower():
-                if logger:
-                    logger.log(f"🚫 モデレーションエラー: {operation_name}をスキップします")
-                raise
+            if breaker:
+                breaker.record_success()
             
-            # クレジット不足エラーもリトライしない
-            if "credit" in str(e).lower() or "billing" in str(e).lower():
-                if logger:
-                    logger.log(f"💳 クレジット不足エラー: {operation_name}を中断します")
-                raise
+            # 成功した場合、リトライ情報をログ出力
+            if retry > 0 and logger:
+                logger.log(f"✅ {operation_name}が成功しました（リトライ {retry}回目で成功）")
             
-            # 最後のリトライでなければ待機して再試行
-            if retry < max_retries - 1:
-                wait_time = base_delay * (retry + 1)  # 5秒、10秒、15秒...
-                
-                if logger:
-                    logger.log(f"⚠️ {operation_name}でエラー: {e}")
-                    logger.log(f"🔄 {wait_time}秒後にリトライします（{retry + 1}/{max_retries}回目）")
-                else:
-                    print(f"⚠️ リトライ {retry + 1}/{max_retries}: {e}")
-                
-                time.sleep(wait_time)
-            else:
-                # 最後のリトライも失敗
-                if logger:
-                    logger.log(f"🚨 {operation_name}が{max_retries}回のリトライ後も失敗しました")
-                    logger.log(f"最終エラー: {e}")
-                raise
+            return result
+            
+        except Exception as e:
+            last_exception = e
+            wait_time = _handle_api_error(
+                e, retry, max_retries, base_delay, max_delay, logger, operation_name, breaker, provider
+            )
+        
+        await asyncio.sleep(_wait_within_deadline(wait_time, deadline, operation_name, last_exception))
     
     # ここには到達しないはずだが、念のため
     if last_exception:
@@ -109,36 +478,27 @@ def is_retryable_error(error: Exception) -> bool:
     Returns:
         bool: リトライ可能な場合True
     """
-    error_str = str(error).lower()
+    # 既知の SDK 例外は型で判定
+    if isinstance(error, _NON_RETRYABLE_EXC):
+        return False
+    if isinstance(error, _RETRYABLE_EXC):
+        return True
+    
+    # HTTP ステータスコードを持つ例外（requests / httpx 等）
+    status_code = getattr(error, "status_code", None)
+    if status_code in RETRYABLE_STATUS_CODES:
+        return True
+    
+    # 未知の例外はメッセージのキーワードで判定
+    error_str = str(error)
     
     # リトライ不可能なエラー
-    non_retryable = [
-        "content_policy",
-        "moderation",
-        "credit",
-        "billing",
-        "invalid_api_key",
-        "authentication"
-    ]
-    
-    for keyword in non_retryable:
-        if keyword in error_str:
-            return False
+    if NON_RETRYABLE_ERROR_PATTERN.search(error_str):
+        return False
     
     # リトライ可能なエラー
-    retryable = [
-        "timeout",
-        "connection",
-        "network",
-        "503",  # Service Unavailable
-        "502",  # Bad Gateway
-        "500",  # Internal Server Error
-        "429"   # Rate Limit
-    ]
-    
-    for keyword in retryable:
-        if keyword in error_str:
-            return True
+    if RETRYABLE_ERROR_PATTERN.search(error_str):
+        return True
     
     # デフォルトはリトライする
     return True
\ No newline at end of file
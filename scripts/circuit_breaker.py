@@ -0,0 +1,102 @@
+"""
+APIプロバイダーごとのサーキットブレーカー
+
+障害中のプロバイダーに対して毎回リトライを使い切らないよう、
+連続失敗が閾値に達したら一定時間は即座に失敗させる（fail-fast）
+"""
+import threading
+import time
+from typing import Dict
+
+# 状態
+STATE_CLOSED = "closed"        # 通常（呼び出しを通す）
+STATE_OPEN = "open"            # 遮断中（即座に失敗）
+STATE_HALF_OPEN = "half_open"  # 試験的に少数の呼び出しだけ通す
+
+
+class CircuitOpenError(Exception):
+    """サーキットが開いている（プロバイダー障害中）ため呼び出しを行わなかった"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    closed / open / half-open の3状態を持つサーキットブレーカー（スレッドセーフ）
+
+    Args:
+        failure_threshold: open に切り替える連続失敗回数
+        open_seconds: open を維持する秒数（経過後に half-open へ）
+        half_open_max: half-open 中に同時に通す試験呼び出しの数
+    """
+
+    def __init__(self, failure_threshold: int = 5, open_seconds: float = 60, half_open_max: int = 1):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max = half_open_max
+        
+        self.state = STATE_CLOSED
+        self.failure_count = 0
+        self.opened_at = 0.0
+        self._half_open_calls = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """呼び出しを行ってよいか判定（half-open 中は試験呼び出しの枠を確保する）"""
+        with self._lock:
+            if self.state == STATE_OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    return False
+                self.state = STATE_HALF_OPEN
+                self._half_open_calls = 0
+            
+            if self.state == STATE_HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max:
+                    return False
+                self._half_open_calls += 1
+            
+            return True
+
+    def remaining_open_seconds(self) -> float:
+        """open が解除されるまでの残り秒数"""
+        with self._lock:
+            if self.state != STATE_OPEN:
+                return 0.0
+            return max(self.open_seconds - (time.monotonic() - self.opened_at), 0.0)
+
+    def record_success(self):
+        """成功を記録（closed に戻す）"""
+        with self._lock:
+            self.state = STATE_CLOSED
+            self.failure_count = 0
+            self._half_open_calls = 0
+
+    def record_failure(self):
+        """
+        失敗を記録
+        
+        Returns:
+            bool: この失敗で open に切り替わった場合 True
+        """
+        with self._lock:
+            self.failure_count += 1
+            if self.state == STATE_HALF_OPEN or self.failure_count >= self.failure_threshold:
+                tripped = self.state != STATE_OPEN
+                self.state = STATE_OPEN
+                self.opened_at = time.monotonic()
+                self._half_open_calls = 0
+                return tripped
+            return False
+
+
+# プロバイダー名 → ブレーカー（プロセス内で共有）
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    """プロバイダーのサーキットブレーカーを取得（初回のみ生成）"""
+    with _breakers_lock:
+        breaker = _BREAKERS.get(provider)
+        if breaker is None:
+            breaker = _BREAKERS[provider] = CircuitBreaker()
+        return breaker
@@ -3,6 +3,8 @@
 クラウド環境への移行やバッチAPI利用を見据えた設計
 """
 import os
+from enum import IntEnum
+from types import MappingProxyType
 
 # --- 環境判定 ---
 IS_CLOUD_RUN = os.getenv("K_SERVICE") is not None  # Cloud Run環境かどうか
@@ -43,10 +45,13 @@ IMAGE_SIZE = "1024x1536"
 IMAGE_QUALITY = "high"
 
 # --- Phase 1.3: モーションプロンプト設定 ---
-# Hailuo 2.3 Fast
-HAILUO_MODEL = "MiniMax-Hailuo-2.3-Fast"
-HAILUO_DURATION = 6  # 秒
-HAILUO_RESOLUTION = "768P"
+# Hailuo (MiniMax) 動画生成設定
+HAILUO_MODEL = "MiniMax-Hailuo-2.3-Fast"    # Fastモデル (I2Vのみ、高速・低コスト)
+HAILUO_RESOLUTION = "768P"                   # 768P or 1080P (1080Pは6秒まで)
+HAILUO_DURATION = 6                          # 動画の長さ (秒): 6 or 10
+HAILUO_POLL_INTERVAL = 15                    # ポーリング間隔 (秒)
+HAILUO_MAX_WAIT_TIME = 300                   # タイムアウト (秒): 5分
+# APIキーは環境変数 MINIMAX_API_KEY（.env / 本番は Secret Manager）
 
 # --- Phase 2: 画像生成設定 ---
 # テストモード: 0=全画像生成, 1以上=指定枚数のみ生成
@@ -59,6 +64,21 @@ TEST_MODE_LIMIT = 0
 BATCH_API_ENABLED = False  # バッチAPI利用時にTrueに変更
 BATCH_CHECK_INTERVAL = 300  # 5分ごとにステータス確認
 BATCH_MAX_WAIT_TIME = 86400  # 最大24時間待機
+BATCH_MIN_POLL_INTERVAL = 5  # 結果取得ループのポーリング初期間隔（秒）。確認ごとに倍増
+BATCH_MAX_POLL_INTERVAL = 300  # 結果取得ループのポーリング間隔の上限（秒）
+BATCH_CHECK_CONCURRENCY = 8  # ステータス確認の同時実行数
+BATCH_LIST_PAGE_SIZE = 100  # batches.list で一括取得する1ページの件数
+BATCH_LIST_MAX_PAGES = 2  # batches.list を辿る最大ページ数（見つからない分は個別に retrieve）
+BATCH_POLL_BASE_INTERVAL = 30  # クローラーのポーリング間隔の下限（秒）
+BATCH_POLL_AGE_FACTOR = 10  # ポーリング間隔 = 係数 × √(送信からの経過秒数)
+BATCH_POLL_MAX_INTERVAL = 300  # ポーリング間隔の上限（秒）
+BATCH_POLL_JITTER = 15  # ポーリング間隔に加えるランダム揺らぎの最大値（秒）
+BATCH_STATUS_SAVE_MAX_ATTEMPTS = 3  # batch_status.json (GCS) の競合時の最大保存試行回数
+BATCH_STATUS_API_TIMEOUT = 15.0  # ステータス確認APIのタイムアウト（秒）。SDK既定の600秒だとループ全体が止まる
+BATCH_STATUS_API_CONNECT_TIMEOUT = 5.0  # ステータス確認APIの接続タイムアウト（秒）
+BATCH_STATUS_API_MAX_RETRIES = 1  # SDK内部のリトライ回数（それ以上は次回のポーリングに任せる）
+BATCH_RETRIEVE_API_TIMEOUT = 60.0  # 結果取得スクリプトのAPIタイムアウト（秒）
+BATCH_RETRIEVE_API_MAX_RETRIES = 5  # 結果取得スクリプトのSDK内部リトライ回数（5xx・接続エラー時に指数バックオフ）
 
 # --- クラウド環境設定（将来用） ---
 CLOUD_STORAGE_ENABLED = False  # クラウドストレージ利用時にTrueに
@@ -75,47 +95,58 @@ LOG_SUFFIX_PHASE3 = "_phase3_gdrive.txt"
 API_RETRY_COUNT = 3
 API_RETRY_DELAY = 2  # 秒
 MAX_RETRIES = 3  # エラー3回でアウト
+API_ATTEMPT_TIMEOUT = 180.0  # API呼び出し1回あたりのタイムアウト（秒）。応答が止まった呼び出しはリトライに回す
+API_CONNECT_TIMEOUT = 5.0  # API呼び出しの接続タイムアウト（秒）
 
 # --- 並列処理設定（将来用） ---
 MAX_WORKERS = 4  # 並列処理時の最大ワーカー数
+DRIVE_UPLOAD_CONCURRENCY = 8  # Google Drive への画像アップロードの同時実行数
+DRIVE_DOWNLOAD_CONCURRENCY = 8  # Google Drive からの画像ダウンロードの同時実行数
+# プロバイダー別の同時API呼び出し数（バルクヘッド）。1つのプロバイダーの遅延が他の枠を食い潰さないよう分離する
+PROVIDER_POOLS = MappingProxyType({
+    "claude": 4,
+    "openai": 8
+})
 
 # --- Phase別タイムアウト設定 ---
-# 🔧 修正: main_pipeline.py で使用される正確な名前に合わせる
-PHASE_TIMEOUTS = {
-    "Phase 1.1 (Character Settings)": 600,     # 10分
-    "Phase 1.2 (Claude Prompts)": 86400,       # 24時間 (プロンプト生成) 🔧 延長
-    "Phase 2 (GPT Images)": 86400,             # 24時間 (画像生成) 🔧 延長
-    "Phase 3 (Google Drive Upload)": 11800,     # 30分
-    "Phase 1.3 (Motion Prompts)": 86400,      # 24時間
-    "Phase 2.5 (Video Generation)": 86400,    # 24時間
-    
-
-    # 🆕 バッチAPI用（将来実装）
-    "Phase 1.2-A (Batch Submit)": 300,         # 5分
-    "Phase 1.2-B (Batch Retrieve)": 86400,     # 24時間
-    "Phase 2-A (GPT Batch Submit)": 300,       # 5分
-    "Phase 2-B (GPT Batch Retrieve)": 86400,   # 24時間
-}
-
-# ==================================================
-# config.py に追加する設定（既存の設定の末尾に追加）
-# ==================================================
-
-# --- Hailuo (MiniMax) 動画生成設定 ---
-HAILUO_MODEL = "MiniMax-Hailuo-2.3-Fast"    # Fastモデル (I2Vのみ、高速・低コスト)
-HAILUO_RESOLUTION = "768P"                   # 768P or 1080P (1080Pは6秒まで)
-HAILUO_DURATION = 6                          # 動画の長さ (秒): 6 or 10
-HAILUO_POLL_INTERVAL = 15                    # ポーリング間隔 (秒)
-HAILUO_MAX_WAIT_TIME = 300                   # タイムアウト (秒): 5分
-
-# --- .env に追加する環境変数 ---
-# MINIMAX_API_KEY=your-api-key-here
-
-# --- Secret Manager に追加 (本番環境) ---
-# gcloud secrets create MINIMAX_API_KEY --data-file=-
-
-
-
-
-
-
+class Phase(IntEnum):
+    """パイプラインのフェーズ（PHASE_LABELS / PHASE_TIMEOUTS の添字）"""
+    P1_1 = 0              # キャラクター設定生成
+    P1_2 = 1              # プロンプト生成
+    P2 = 2                # 画像生成
+    P3 = 3                # Google Drive アップロード
+    P1_3 = 4              # モーションプロンプト生成
+    P2_5 = 5              # 動画生成
+    # 🆕 バッチAPI用
+    P1_2_BATCH_SUBMIT = 6
+    P1_2_BATCH_RETRIEVE = 7
+    P2_BATCH_SUBMIT = 8
+    P2_BATCH_RETRIEVE = 9
+
+# ログ表示用のフェーズ名（Phase の順）
+PHASE_LABELS = (
+    "Phase 1.1 (Character Settings)",
+    "Phase 1.2 (Claude Prompts)",
+    "Phase 2 (GPT Images)",
+    "Phase 3 (Google Drive Upload)",
+    "Phase 1.3 (Motion Prompts)",
+    "Phase 2.5 (Video Generation)",
+    "Phase 1.2-A (Batch Submit)",
+    "Phase 1.2-B (Batch Retrieve)",
+    "Phase 2-A (GPT Batch Submit)",
+    "Phase 2-B (GPT Batch Retrieve)",
+)
+
+# フェーズごとのタイムアウト（秒、Phase の順）
+PHASE_TIMEOUTS = (
+    600,     # Phase 1.1: 10分
+    86400,   # Phase 1.2: 24時間 (プロンプト生成) 🔧 延長
+    86400,   # Phase 2: 24時間 (画像生成) 🔧 延長
+    11800,   # Phase 3
+    86400,   # Phase 1.3: 24時間
+    86400,   # Phase 2.5: 24時間
+    300,     # Phase 1.2-A: 5分
+    86400,   # Phase 1.2-B: 24時間
+    300,     # Phase 2-A: 5分
+    86400,   # Phase 2-B: 24時間
+)
@@ -5,6 +5,7 @@ Mini版（$0.052）と通常版（$0.25）の混在計算に対応
 """
 
 from datetime import datetime
+from functools import cached_property
 
 
 class CostTracker:
@@ -211,6 +212,15 @@ class CostTracker:
             "prompts_count": self.images_generated + self.images_failed
         }
     
+    def _yen(self, usd):
+        """USD を円（切り捨て）に換算"""
+        return int(usd * self.USD_TO_JPY)
+    
+    @cached_property
+    def _summary_header(self):
+        """詳細サマリーの見出し（プロジェクト名と開始時刻は変わらないので1回だけ生成）"""
+        return f"{'='*60}\n{self.project_name} - コストサマリー ({self.timestamp:%Y-%m-%d %H:%M:%S})\n{'='*60}"
+    
     def get_detailed_summary(self):
         """
         詳細サマリー（ログ出力用）
@@ -233,26 +243,24 @@ class CostTracker:
   - 失敗: {self.images_failed}枚"""
         
         summary = f"""
-{'='*60}
-{self.project_name} - コストサマリー ({self.timestamp.strftime('%Y-%m-%d %H:%M:%S')})
-{'='*60}
+{self._summary_header}
 
-Phase 1.1: ${self.phase_1_1_cost:.2f} (約{int(self.phase_1_1_cost * self.USD_TO_JPY)}円)
+Phase 1.1: ${self.phase_1_1_cost:.2f} (約{self._yen(self.phase_1_1_cost)}円)
 
-Phase 1.2: ${self.phase_1_2_cost:.2f} (約{int(self.phase_1_2_cost * self.USD_TO_JPY)}円)
+Phase 1.2: ${self.phase_1_2_cost:.2f} (約{self._yen(self.phase_1_2_cost)}円)
   - キャッシュ作成: {self.cache_creation_tokens:,} tokens
   - キャッシュ読込: {self.cache_read_tokens:,} tokens
   - 通常入力: {self.input_tokens:,} tokens
   - 出力: {self.output_tokens:,} tokens
 
-Phase 2: ${self.phase_2_cost:.2f} (約{int(self.phase_2_cost * self.USD_TO_JPY)}円)
+Phase 2: ${self.phase_2_cost:.2f} (約{self._yen(self.phase_2_cost)}円)
 {phase_2_breakdown}
 
-Phase 2.5: ${self.phase_2_5_cost:.2f} (約{int(self.phase_2_5_cost * self.USD_TO_JPY)}円)
+Phase 2.5: ${self.phase_2_5_cost:.2f} (約{self._yen(self.phase_2_5_cost)}円)
   - 動画生成: {self.videos_generated}本 × ${self.HAILUO_PRICES.get(self.video_model, 0.14):.2f}
   - 失敗: {self.videos_failed}本
 
-Cloud Run: ${self.cloud_run_cost:.2f} (約{int(self.cloud_run_cost * self.USD_TO_JPY)}円)
+Cloud Run: ${self.cloud_run_cost:.2f} (約{self._yen(self.cloud_run_cost)}円)
   - 実行時間: {self.cloud_run_duration:.0f}秒 ({self.cloud_run_duration/60:.1f}分)
 
 {'-'*60}
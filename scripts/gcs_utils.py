@@ -2,6 +2,9 @@
 Google Cloud Storage 関連のユーティリティ
 """
 import os
+import threading
+import google.auth
+from google.auth.transport.requests import AuthorizedSession
 from google.cloud import storage
 from config import PROJECT_ROOT
 
@@ -9,10 +12,27 @@ from config import PROJECT_ROOT
 GCS_BUCKET_NAME = "ai-image-pipeline-scripts"
 GCS_INPUT_FOLDER = os.environ.get("GCS_INPUT_FOLDER", "input-short/")
 
+# クライアント（認証済みセッション + コネクションプール）はプロセス内で共有
+_gcs_client = None
+_gcs_client_lock = threading.Lock()
+
 def get_gcs_client():
-    """GCS クライアントを取得"""
-    # Cloud Run でもローカルでもデフォルト認証を使う
-    return storage.Client()
+    """
+    GCS クライアントを取得（初回のみ生成、スレッドセーフ）
+    
+    認証情報と AuthorizedSession を1つだけ作り、TLS 接続とアクセストークンを使い回す
+    """
+    global _gcs_client
+    with _gcs_client_lock:
+        if _gcs_client is None:
+            # Cloud Run でもローカルでもデフォルト認証を使う
+            credentials, project = google.auth.default()
+            _gcs_client = storage.Client(
+                project=project,
+                credentials=credentials,
+                _http=AuthorizedSession(credentials)
+            )
+    return _gcs_client
 
 def list_gcs_scripts():
     """
@@ -3,10 +3,22 @@ Google Drive チェックポイント機能（JSONL形式対応版）
 Cloud Run での冪等性を実現するため、Drive から既存ファイルを一括取得
 """
 import os
-import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
-from config import BASE_DIR, CREDENTIALS_FILE, TOKEN_FILE, GDRIVE_SCOPES
+from config import BASE_DIR, CREDENTIALS_FILE, TOKEN_FILE, GDRIVE_SCOPES, DRIVE_DOWNLOAD_CONCURRENCY
+
+# 認証情報はプロセス内で1回だけ取得し、Drive API サービスはスレッドごとに使い回す
+_drive_creds = None
+_drive_creds_lock = threading.Lock()
+_drive_local = threading.local()
+
+# (親フォルダID, フォルダ名) → フォルダID
+_folder_id_cache = {}
+
+# ローカルにダウンロードする画像の拡張子
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
 
 
 def authenticate_gdrive():
@@ -45,6 +57,71 @@ def authenticate_gdrive():
     return creds
 
 
+def get_drive_service():
+    """
+    Drive API サービスを取得（認証はプロセス内で1回、サービスはスレッドごとに1回だけ生成）
+    
+    httplib2 はスレッドセーフではないため、サービスはスレッド間で共有しない
+    
+    Returns:
+        Resource: Drive API サービス、認証失敗時は None
+    """
+    global _drive_creds
+    service = getattr(_drive_local, "service", None)
+    if service is not None:
+        return service
+    
+    with _drive_creds_lock:
+        if _drive_creds is None:
+            _drive_creds = authenticate_gdrive()
+        creds = _drive_creds
+    
+    if not creds:
+        return None
+    
+    # cache_discovery=False: ディスカバリー文書のファイルキャッシュを探しに行かない
+    service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+    _drive_local.service = service
+    return service
+
+
+def _find_folder_on_drive(service, name, parent_folder_id):
+    """
+    親フォルダ直下のフォルダを名前で検索（見つかった ID はプロセス内でキャッシュ）
+    
+    フォルダ ID は実行中に変わらないため、同じフォルダの検索で Drive API を何度も呼ばない。
+    見つからなかった場合は後から作成される可能性があるのでキャッシュしない
+    
+    Returns:
+        str: フォルダID、見つからない場合は None
+    """
+    key = (parent_folder_id, name)
+    folder_id = _folder_id_cache.get(key)
+    if folder_id:
+        return folder_id
+    
+    query = f"name='{name}' and '{parent_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
+    results = service.files().list(
+        q=query,
+        spaces='drive',
+        fields='files(id)',
+        pageSize=1
+    ).execute()
+    
+    files = results.get('files', [])
+    if not files:
+        return None
+    
+    folder_id = files[0]['id']
+    _folder_id_cache[key] = folder_id
+    return folder_id
+
+
+def remember_folder_on_drive(name, parent_folder_id, folder_id):
+    """作成したフォルダの ID をキャッシュに登録（作成直後の検索に反映されなくても再作成しない）"""
+    _folder_id_cache[(parent_folder_id, name)] = folder_id
+
+
 def find_project_folder_on_drive(service, project_name, parent_folder_id):
     """
     Google Drive 上でプロジェクトフォルダを検索
@@ -58,27 +135,92 @@ def find_project_folder_on_drive(service, project_name, parent_folder_id):
         str: フォルダID、見つからない場合は None
     """
     try:
-        query = f"name='{project_name}' and '{parent_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
+        return _find_folder_on_drive(service, project_name, parent_folder_id)
+    
+    except Exception as e:
+        print(f"⚠️ プロジェクトフォルダの検索中にエラー: {e}")
+        return None
+
+
+def find_images_folder_on_drive(service, project_folder_id):
+    """
+    プロジェクトフォルダ内の images フォルダを検索
+    
+    Returns:
+        str: フォルダID、見つからない場合は None
+    """
+    return _find_folder_on_drive(service, 'images', project_folder_id)
+
+
+def list_files_in_drive_folder(service, folder_id, fields='id, name', mime_type=None, order_by=None):
+    """
+    フォルダ直下のファイルを全件取得（nextPageToken をたどり、1000件を超えても取りこぼさない）
+    
+    Args:
+        service: Google Drive API サービス
+        folder_id: フォルダID
+        fields: 取得するファイルのフィールド（必要なものだけ指定して応答を小さくする）
+        mime_type: 指定した MIME タイプのファイルだけに絞り込む（Drive 側で絞り込む）
+        order_by: 並び順（例: 'name'。Drive 側で並べ替える）
+    
+    Returns:
+        list: ファイル情報（dict）のリスト
+    """
+    query = f"'{folder_id}' in parents and trashed=false"
+    if mime_type:
+        query += f" and mimeType='{mime_type}'"
+    drive_files = []
+    page_token = None
+    while True:
         results = service.files().list(
             q=query,
             spaces='drive',
-            fields='files(id, name)'
+            fields=f'nextPageToken, files({fields})',
+            pageSize=1000,
+            orderBy=order_by,
+            pageToken=page_token
         ).execute()
-        
-        files = results.get('files', [])
-        if files:
-            return files[0]['id']
-        return None
+        drive_files.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return drive_files
+
+
+class _PromptLineCounter:
+    """
+    MediaIoBaseDownload の書き込み先として、prompts_data.jsonl の有効な行数だけを数える
     
-    except Exception as e:
-        print(f"⚠️ プロジェクトフォルダの検索中にエラー: {e}")
-        return None
+    JSON はパースせず、index と image_prompt の両方を含み } で閉じている行を1件とする
+    （書き込み途中で途切れた最終行は数えない）
+    """
+    
+    def __init__(self):
+        self.count = 0
+        self._partial = b""
+    
+    def _count_line(self, line):
+        if b'"index"' in line and b'"image_prompt"' in line and line.rstrip().endswith(b"}"):
+            self.count += 1
+    
+    def write(self, data):
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._count_line(line)
+        return len(data)
+    
+    def finish(self):
+        """最後の改行なしの行を処理して件数を返す"""
+        if self._partial:
+            self._count_line(self._partial)
+            self._partial = b""
+        return self.count
 
 
 def get_existing_prompts_count(service, project_folder_id):
     """
     Google Drive 上の prompts_data.jsonl から既存プロンプト数を取得
-    JSONL形式の行数をカウントして正確な数を返す
+    JSONL形式の行数をダウンロードしながらカウントして返す
     
     Args:
         service: Google Drive API サービス
@@ -93,7 +235,7 @@ def get_existing_prompts_count(service, project_folder_id):
         results = service.files().list(
             q=query,
             spaces='drive',
-            fields='files(id)'
+            fields='files(id, size)'
         ).execute()
         
         files = results.get('files', [])
@@ -101,32 +243,24 @@ def get_existing_prompts_count(service, project_folder_id):
             print("📁 Drive に prompts_data.jsonl が見つかりません。最初から生成します。")
             return 0
         
-        # ファイル内容をダウンロード
+        # 空ファイルはダウンロードせずに 0 件とする（メタデータのサイズで判定）
+        if files[0].get('size') == '0':
+            print("📁 Drive の prompts_data.jsonl は空です。最初から生成します。")
+            return 0
+        
+        # ファイル内容をダウンロードしながら行を数える（全体を保持・デコードしない）
         file_id = files[0]['id']
         from googleapiclient.http import MediaIoBaseDownload
-        import io
         
         request = service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
+        counter = _PromptLineCounter()
+        downloader = MediaIoBaseDownload(counter, request)
         
         done = False
         while not done:
             status, done = downloader.next_chunk()
         
-        # 内容を解析（JSONL形式 = 行数をカウント）
-        content = fh.getvalue().decode('utf-8')
-        lines = [line.strip() for line in content.split('\n') if line.strip()]
-        
-        # 有効なJSON行のみカウント
-        count = 0
-        for line in lines:
-            try:
-                data = json.loads(line)
-                if 'index' in data and 'image_prompt' in data:
-                    count += 1
-            except json.JSONDecodeError:
-                continue
+        count = counter.finish()
         
         print(f"✅ Drive から {count} 個の既存プロンプトを検出しました。")
         return count
@@ -150,34 +284,19 @@ def get_existing_images_list(service, project_folder_id):
     """
     try:
         # images フォルダを検索
-        query = f"name='images' and '{project_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
-        results = service.files().list(
-            q=query,
-            spaces='drive',
-            fields='files(id)'
-        ).execute()
-        
-        files = results.get('files', [])
-        if not files:
+        images_folder_id = find_images_folder_on_drive(service, project_folder_id)
+        if not images_folder_id:
             print("📁 Drive に images フォルダが見つかりません。最初から生成します。")
             return []
         
-        images_folder_id = files[0]['id']
-        
-        # images フォルダ内の .png ファイルを全て取得
-        query = f"'{images_folder_id}' in parents and trashed=false"
-        results = service.files().list(
-            q=query,
-            spaces='drive',
-            fields='files(name)',
-            pageSize=1000  # 最大1000ファイル
-        ).execute()
-        
-        image_files = results.get('files', [])
-        image_names = [f['name'] for f in image_files if f['name'].endswith('.png')]
+        # images フォルダ内の PNG ファイルを名前順で全て取得（絞り込み・並べ替えは Drive 側で行う）
+        image_files = list_files_in_drive_folder(
+            service, images_folder_id, fields='name', mime_type='image/png', order_by='name'
+        )
+        image_names = [f['name'] for f in image_files]
         
         print(f"✅ Drive から {len(image_names)} 枚の既存画像を検出しました。")
-        return sorted(image_names)
+        return image_names
     
     except Exception as e:
         print(f"⚠️ 画像リストの取得中にエラー: {e}")
@@ -201,13 +320,11 @@ def check_drive_checkpoint(project_name, parent_folder_id, checkpoint_type="prom
     """
     try:
         # 認証
-        creds = authenticate_gdrive()
-        if not creds:
+        service = get_drive_service()
+        if not service:
             print("⚠️ Drive 認証に失敗しました。チェックポイントなしで実行します。")
             return 0 if checkpoint_type == "prompts" else []
         
-        service = build('drive', 'v3', credentials=creds)
-        
         # プロジェクトフォルダを検索
         project_folder_id = find_project_folder_on_drive(service, project_name, parent_folder_id)
         
@@ -231,6 +348,84 @@ def check_drive_checkpoint(project_name, parent_folder_id, checkpoint_type="prom
         return 0 if checkpoint_type == "prompts" else []
 
 
+def _download_drive_file(file_id, local_path):
+    """
+    1ファイルをダウンロード（一時ファイルに書いてから置き換える）
+    
+    途中で失敗しても中途半端なファイルが残らないため、次回の「既にローカルにある」判定を誤らない
+    """
+    from googleapiclient.http import MediaIoBaseDownload
+    
+    # ワーカースレッドごとのサービスを使う（httplib2 はスレッド間で共有できない）
+    service = get_drive_service()
+    request = service.files().get_media(fileId=file_id)
+    tmp_path = local_path + ".part"
+    try:
+        with open(tmp_path, 'wb') as f:
+            downloader = MediaIoBaseDownload(f, request)
+            
+            done = False
+            while not done:
+                status, done = downloader.next_chunk()
+        os.replace(tmp_path, local_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def download_files_from_drive(file_list, local_dir, log, total_count):
+    """
+    Drive のファイルを DRIVE_DOWNLOAD_CONCURRENCY 並列でローカルにダウンロード
+    
+    Args:
+        file_list: (ファイルID, ファイル名) のリスト
+        local_dir: 保存先ディレクトリ
+        log: ログ出力関数
+        total_count: 進捗表示の分母
+    
+    Returns:
+        int: ローカルに揃ったファイル数（既にあったものを含む）
+    """
+    # ローカルの既存ファイル名は1回の走査でまとめて取得（ファイルごとに stat しない）
+    try:
+        existing = {entry.name for entry in os.scandir(local_dir)}
+    except FileNotFoundError:
+        existing = set()
+    
+    downloaded = 0
+    pending = []
+    for file_id, filename in file_list:
+        # 既にローカルにある場合はスキップ
+        if filename in existing:
+            downloaded += 1
+            continue
+        pending.append((file_id, filename, os.path.join(local_dir, filename)))
+    
+    if not pending:
+        return downloaded
+    
+    with ThreadPoolExecutor(max_workers=DRIVE_DOWNLOAD_CONCURRENCY, thread_name_prefix="drive_download") as executor:
+        futures = {
+            executor.submit(_download_drive_file, file_id, local_path): filename
+            for file_id, filename, local_path in pending
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                log(f"  ⚠️ {futures[future]} のダウンロードに失敗: {e}")
+                continue
+            
+            downloaded += 1
+            
+            # 進捗表示（20枚ごと）
+            if downloaded % 20 == 0:
+                log(f"  📥 {downloaded}/{total_count} 枚ダウンロード済み")
+    
+    return downloaded
+
+
 def download_images_from_drive(project_name, local_images_dir, logger=None):
     """
     Google Drive から画像をローカルにダウンロード
@@ -251,21 +446,16 @@ def download_images_from_drive(project_name, local_images_dir, logger=None):
             print(msg)
     
     try:
-        from googleapiclient.http import MediaIoBaseDownload
-        import io
-        
         parent_folder_id = os.environ.get("GDRIVE_PARENT_FOLDER_ID")
         if not parent_folder_id:
             log("⚠️ GDRIVE_PARENT_FOLDER_ID が設定されていません")
             return 0
         
-        creds = authenticate_gdrive()
-        if not creds:
+        service = get_drive_service()
+        if not service:
             log("⚠️ Drive 認証に失敗しました")
             return 0
         
-        service = build('drive', 'v3', credentials=creds)
-        
         # プロジェクトフォルダを検索
         project_folder_id = find_project_folder_on_drive(service, project_name, parent_folder_id)
         if not project_folder_id:
@@ -273,24 +463,13 @@ def download_images_from_drive(project_name, local_images_dir, logger=None):
             return 0
         
         # images フォルダを検索
-        query = f"name='images' and '{project_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
-        results = service.files().list(q=query, spaces='drive', fields='files(id)').execute()
-        folders = results.get('files', [])
-        
-        if not folders:
+        images_folder_id = find_images_folder_on_drive(service, project_folder_id)
+        if not images_folder_id:
             log("⚠️ Drive に images フォルダが見つかりません")
             return 0
         
-        images_folder_id = folders[0]['id']
-        
         # 画像ファイル一覧を取得
-        query = f"'{images_folder_id}' in parents and trashed=false"
-        results = service.files().list(
-            q=query, spaces='drive',
-            fields='files(id, name)',
-            pageSize=1000
-        ).execute()
-        drive_files = results.get('files', [])
+        drive_files = list_files_in_drive_folder(service, images_folder_id)
         
         if not drive_files:
             log("⚠️ Drive に画像ファイルがありません")
@@ -301,43 +480,12 @@ def download_images_from_drive(project_name, local_images_dir, logger=None):
         
         log(f"☁️  Drive から {len(drive_files)} 枚の画像をダウンロード中...")
         
-        downloaded = 0
-        for file_info in drive_files:
-            file_id = file_info['id']
-            filename = file_info['name']
-            
-            # PNG ファイルのみ
-            if not filename.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')):
-                continue
-            
-            local_path = os.path.join(local_images_dir, filename)
-            
-            # 既にローカルにある場合はスキップ
-            if os.path.exists(local_path):
-                downloaded += 1
-                continue
-            
-            try:
-                request = service.files().get_media(fileId=file_id)
-                fh = io.BytesIO()
-                downloader = MediaIoBaseDownload(fh, request)
-                
-                done = False
-                while not done:
-                    status, done = downloader.next_chunk()
-                
-                with open(local_path, 'wb') as f:
-                    f.write(fh.getvalue())
-                
-                downloaded += 1
-                
-                # 進捗表示（20枚ごと）
-                if downloaded % 20 == 0:
-                    log(f"  📥 {downloaded}/{len(drive_files)} 枚ダウンロード済み")
-            
-            except Exception as e:
-                log(f"  ⚠️ {filename} のダウンロードに失敗: {e}")
-                continue
+        # 画像ファイルのみ
+        image_files = [
+            (file_info['id'], file_info['name']) for file_info in drive_files
+            if file_info['name'].lower().endswith(IMAGE_EXTENSIONS)
+        ]
+        downloaded = download_files_from_drive(image_files, local_images_dir, log, len(drive_files))
         
         log(f"✅ {downloaded} 枚の画像をダウンロードしました")
         return downloaded
@@ -366,19 +514,14 @@ def download_motion_prompts_from_drive(project_name, local_path, logger=None):
             print(msg)
     
     try:
-        from googleapiclient.http import MediaIoBaseDownload
-        import io
-        
         parent_folder_id = os.environ.get("GDRIVE_PARENT_FOLDER_ID")
         if not parent_folder_id:
             return False
         
-        creds = authenticate_gdrive()
-        if not creds:
+        service = get_drive_service()
+        if not service:
             return False
         
-        service = build('drive', 'v3', credentials=creds)
-        
         # プロジェクトフォルダを検索
         project_folder_id = find_project_folder_on_drive(service, project_name, parent_folder_id)
         if not project_folder_id:
@@ -393,20 +536,14 @@ def download_motion_prompts_from_drive(project_name, local_path, logger=None):
             log("⚠️ Drive に motion_prompts_list.txt が見つかりません")
             return False
         
-        # ダウンロード
+        # ダウンロード（小さいテキストなので1回の GET で本文をまとめて受け取る）
         file_id = files[0]['id']
-        request = service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
+        content = service.files().get_media(fileId=file_id).execute()
         
         # ローカルに保存
         os.makedirs(os.path.dirname(local_path), exist_ok=True)
         with open(local_path, 'wb') as f:
-            f.write(fh.getvalue())
+            f.write(content)
         
         log(f"☁️  Drive から motion_prompts_list.txt をダウンロードしました")
         return True
@@ -0,0 +1,81 @@
+"""
+JSON シリアライズのユーティリティ
+orjson がインストールされていれば使用し（高速）、無ければ標準の json にフォールバック
+"""
+import os
+import json
+
+# orjson をインポート（存在する場合のみ）
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def json_dumps_bytes(data, indent=False):
+    """
+    UTF-8 の bytes にシリアライズ（ensure_ascii=False 相当）
+    
+    Args:
+        data: シリアライズするオブジェクト
+        indent (bool): True の場合は2スペースでインデント
+    
+    Returns:
+        bytes: UTF-8 エンコード済みの JSON
+    """
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+    
+    if indent:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+def json_loads(data):
+    """
+    JSON をパース
+    
+    Args:
+        data (bytes | str): JSON データ
+    
+    Returns:
+        パース結果
+    
+    Raises:
+        ValueError: JSON として不正な場合（json / orjson の JSONDecodeError はどちらも ValueError のサブクラス）
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def write_json_atomic(path, data):
+    """
+    JSON ファイルをアトミックに書き込む（2スペースインデント）
+    
+    一時ファイルに書き出してから os.replace で置き換えるため、
+    書き込み中にプロセスが強制終了されても中途半端なファイルが残らない
+    
+    Args:
+        path (str): 書き込み先のパス
+        data: シリアライズするオブジェクト
+    """
+    write_bytes_atomic(path, json_dumps_bytes(data, indent=True))
+
+
+def write_bytes_atomic(path, content):
+    """
+    シリアライズ済みの bytes をアトミックに書き込む（write_json_atomic と同じ方式）
+    
+    Args:
+        path (str): 書き込み先のパス
+        content (bytes): 書き込む内容
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
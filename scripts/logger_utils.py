@@ -13,13 +13,16 @@ class DualLogger:
     Windows環境で絵文字が使えない問題に対応
     """
     
-    def __init__(self, log_file_path):
+    def __init__(self, log_file_path, flush_each_line=True):
         """
         Args:
             log_file_path (str): エラー時に保存するログファイルのパス
+            flush_each_line (bool): False の場合は行ごとにフラッシュせず、
+                flush() 呼び出し時にまとめて出力（常駐プロセス向け）
         """
         self.log_file_path = log_file_path
         self.log_buffer = []
+        self.flush_each_line = flush_each_line
     
     @staticmethod
     def remove_emojis(text):
@@ -97,20 +100,28 @@ class DualLogger:
         # メモリに保存（元のメッセージ）
         self.log_buffer.append(formatted_message)
         
-        # コンソール出力用に絵文字を除去
-        safe_message = self.remove_emojis(formatted_message)
-        
+        flush = self.flush_each_line
         try:
             # まず通常出力を試みる
-            print(formatted_message, flush=True)  # flush=True でバッファをクリア
+            print(formatted_message, flush=flush)  # flush=True でバッファをクリア
         except UnicodeEncodeError:
-            # 失敗したら絵文字を除去して出力
+            # 失敗したらコンソール出力用に絵文字を除去して出力
+            safe_message = self.remove_emojis(formatted_message)
             try:
-                print(safe_message, flush=True)
+                print(safe_message, flush=flush)
             except Exception:
                 # それでもダメなら ASCII のみ
                 ascii_message = safe_message.encode('ascii', 'replace').decode('ascii')
-                print(ascii_message, flush=True)
+                print(ascii_message, flush=flush)
+    
+    def flush(self):
+        """
+        バッファ済みのコンソール出力をまとめて書き出す（flush_each_line=False 用）
+        """
+        try:
+            sys.stdout.flush()
+        except Exception:
+            pass
     
     def save_on_error(self):
         """
@@ -9,7 +9,7 @@ import json
 import time
 import subprocess
 import traceback
-from config import BATCH_API_ENABLED
+from config import BATCH_API_ENABLED, Phase, PHASE_LABELS, PHASE_TIMEOUTS
 from pathlib import Path
 from gcs_utils import list_gcs_scripts, download_gcs_script
 
@@ -131,13 +131,13 @@ def write_contact_note(project_name, model_name, script_path, start_time):
         return False
 
 
-def run_phase_script(script_path, phase_name):
+def run_phase_script(script_path, phase):
     """
     各フェーズのスクリプトを実行（Windows文字コード対応版）
     
     Args:
         script_path (str): 実行するスクリプトのパス
-        phase_name (str): フェーズ名（ログ用）
+        phase (Phase): 実行するフェーズ（ログ表示名・タイムアウトの取得に使用）
     
     Returns:
         bool: 成功時 True、失敗時 False
@@ -146,9 +146,9 @@ def run_phase_script(script_path, phase_name):
         print(f"🚨 エラー: スクリプトが見つかりません: {script_path}")
         return False
     
-    # Phase ごとのタイムアウトを取得
-    from config import PHASE_TIMEOUTS
-    timeout = PHASE_TIMEOUTS.get(phase_name, 1800)
+    # Phase ごとの表示名とタイムアウトを取得
+    phase_name = PHASE_LABELS[phase]
+    timeout = PHASE_TIMEOUTS[phase]
     
     print(f"\n{'='*50}")
     print(f"▶️ {phase_name} を実行中... (タイムアウト: {timeout}秒)")
@@ -253,7 +253,7 @@ def process_single_project(script_filename, is_gcs):
         return False
     
     # Phase 1.1: キャラクター設定生成
-    if not run_phase_script(PHASE1_1_SCRIPT, "Phase 1.1 (Character Settings)"):
+    if not run_phase_script(PHASE1_1_SCRIPT, Phase.P1_1):
         return False
     
     # Phase 1.2: プロンプト生成
@@ -263,17 +263,17 @@ def process_single_project(script_filename, is_gcs):
         
         # バッチ送信
         batch_submit_script = os.path.join(BASE_DIR, "p1_claude_batch_submit.py")
-        if not run_phase_script(batch_submit_script, "Phase 1.2-A (Batch Submit)"):
+        if not run_phase_script(batch_submit_script, Phase.P1_2_BATCH_SUBMIT):
             return False
         
         # バッチ取得
         batch_retrieve_script = os.path.join(BASE_DIR, "p1_claude_batch_retrieve.py")
-        if not run_phase_script(batch_retrieve_script, "Phase 1.2-B (Batch Retrieve)"):
+        if not run_phase_script(batch_retrieve_script, Phase.P1_2_BATCH_RETRIEVE):
             return False
     else:
         # リアルタイムAPI モード
         print("\n⚡ リアルタイムAPIモードで実行します")
-        if not run_phase_script(PHASE1_2_SCRIPT, "Phase 1.2 (Claude Prompts)"):
+        if not run_phase_script(PHASE1_2_SCRIPT, Phase.P1_2):
             return False
     
     # Phase 2: 画像生成
@@ -283,30 +283,30 @@ def process_single_project(script_filename, is_gcs):
         
         # バッチ送信
         gpt_batch_submit_script = os.path.join(BASE_DIR, "p2_gpt_batch_submit.py")
-        if not run_phase_script(gpt_batch_submit_script, "Phase 2-A (GPT Batch Submit)"):
+        if not run_phase_script(gpt_batch_submit_script, Phase.P2_BATCH_SUBMIT):
             return False
         
         # バッチ取得
         gpt_batch_retrieve_script = os.path.join(BASE_DIR, "p2_gpt_batch_retrieve.py")
-        if not run_phase_script(gpt_batch_retrieve_script, "Phase 2-B (GPT Batch Retrieve)"):
+        if not run_phase_script(gpt_batch_retrieve_script, Phase.P2_BATCH_RETRIEVE):
             return False
     else:
         # リアルタイムAPI モード
         print("\n⚡ リアルタイムAPIモードで実行します（画像生成）")
-        if not run_phase_script(PHASE2_SCRIPT, "Phase 2 (GPT Images)"):
+        if not run_phase_script(PHASE2_SCRIPT, Phase.P2):
             return False
     
     # Phase 1.3: モーションプロンプト生成
-    if not run_phase_script(PHASE1_3_SCRIPT, "Phase 1.3 (Motion Prompts)"):
+    if not run_phase_script(PHASE1_3_SCRIPT, Phase.P1_3):
         return False
     
     # Phase 2.5: 動画生成 (Hailuo)
-    phase2_5_success = run_phase_script(PHASE2_5_SCRIPT, "Phase 2.5 (Video Generation)")
+    phase2_5_success = run_phase_script(PHASE2_5_SCRIPT, Phase.P2_5)
     if not phase2_5_success:
         print("⚠️ Phase 2.5 に失敗しましたが、アップロードは続行します")
     
     # Phase 3: Google Drive アップロード（常に実行）
-    if not run_phase_script(PHASE3_SCRIPT, "Phase 3 (Google Drive Upload)"):
+    if not run_phase_script(PHASE3_SCRIPT, Phase.P3):
         return False
     
     # 処理終了時刻を記録
@@ -14,6 +14,7 @@ import json
 import time
 import traceback
 import anthropic
+import httpx
 import re
 import signal
 from dotenv import load_dotenv
@@ -22,16 +23,17 @@ from dotenv import load_dotenv
 from config import (
     BASE_DIR, LOGS_DIR, LOG_PREFIX_ERROR,
     CLAUDE_MODEL, CLAUDE_MAX_TOKENS,
-    TEST_MODE_LIMIT
+    TEST_MODE_LIMIT, API_ATTEMPT_TIMEOUT, API_CONNECT_TIMEOUT
 )
 from logger_utils import DualLogger
+from json_utils import json_loads
 from project_utils import (
     read_project_info, get_output_dir, ensure_output_dir,
     read_file_safely
 )
-from api_retry_utils import call_api_with_retry
+from api_retry_utils import call_api_with_retry, make_idempotency_key, IDEMPOTENCY_HEADER
 from cost_tracker import CostTracker
-from gdrive_checkpoint import authenticate_gdrive, find_project_folder_on_drive
+from gdrive_checkpoint import find_project_folder_on_drive, get_drive_service
 
 # グローバル変数（中断ハンドラ用）
 _logger = None
@@ -74,19 +76,16 @@ def download_motion_prompts_from_drive(project_name, output_file_path, logger):
     """
     try:
         from googleapiclient.http import MediaIoBaseDownload
-        from googleapiclient.discovery import build
         import io
         
         parent_folder_id = os.getenv("GDRIVE_PARENT_FOLDER_ID")
         if not parent_folder_id:
             return False
         
-        creds = authenticate_gdrive()
-        if not creds:
+        service = get_drive_service()
+        if not service:
             return False
         
-        service = build('drive', 'v3', credentials=creds)
-        
         project_folder_id = find_project_folder_on_drive(service, project_name, parent_folder_id)
         if not project_folder_id:
             return False
@@ -131,18 +130,15 @@ def upload_motion_prompts_to_drive(motion_file_path, project_name, logger):
     """
     try:
         from googleapiclient.http import MediaFileUpload
-        from googleapiclient.discovery import build
         
         parent_folder_id = os.getenv("GDRIVE_PARENT_FOLDER_ID")
         if not parent_folder_id:
             return
         
-        creds = authenticate_gdrive()
-        if not creds:
+        service = get_drive_service()
+        if not service:
             return
         
-        service = build('drive', 'v3', credentials=creds)
-        
         project_folder_id = find_project_folder_on_drive(service, project_name, parent_folder_id)
         
         if not project_folder_id:
@@ -192,18 +188,19 @@ def load_image_prompts(jsonl_file, logger):
         return prompts
     
     try:
-        with open(jsonl_file, 'r', encoding='utf-8') as f:
+        # bytes のまま渡す（orjson はデコード不要でパースできる）
+        with open(jsonl_file, 'rb') as f:
             for line in f:
                 line = line.strip()
                 if not line:
                     continue
                 try:
-                    data = json.loads(line)
+                    data = json_loads(line)
                     prompts.append({
                         "index": data.get("index", len(prompts) + 1),
                         "image_prompt": data.get("image_prompt", "")
                     })
-                except json.JSONDecodeError as e:
+                except ValueError as e:
                     logger.log(f"⚠️ JSONパースエラー: {e}")
                     continue
         
@@ -475,11 +472,13 @@ def generate_motion_prompts(
                                 model=CLAUDE_MODEL,
                                 max_tokens=512,  # モーションプロンプトは短い
                                 system=system_prompt,
-                                messages=[{"role": "user", "content": user_prompt}]
+                                messages=[{"role": "user", "content": user_prompt}],
+                                extra_headers={IDEMPOTENCY_HEADER: make_idempotency_key(_project_name, "phase1_3", prompt_index, retry)}
                             ),
                             max_retries=3,
                             logger=logger,
-                            operation_name=f"モーション生成 ({prompt_index})"
+                            operation_name=f"モーション生成 ({prompt_index})",
+                            provider="claude"
                         )
                         
                         if not response or not response.content:
@@ -631,6 +630,7 @@ def main():
         
         client = anthropic.Anthropic(
             api_key=api_key,
+            timeout=httpx.Timeout(API_ATTEMPT_TIMEOUT, connect=API_CONNECT_TIMEOUT),
             default_headers={"anthropic-beta": "prompt-caching-2024-07-31"}
         )
         logger.log("✅ Anthropic API クライアントを初期化しました（キャッシュ有効）")
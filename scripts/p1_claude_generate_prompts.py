@@ -17,22 +17,25 @@ import json
 import time
 import traceback
 import anthropic
+import httpx
 import xml.etree.ElementTree as ET
 import re  # 🆕 正規表現追加
 import signal
+from collections import deque
 from dotenv import load_dotenv
 
 # 共通モジュールのインポート
 from config import (
     BASE_DIR, LOGS_DIR, LOG_PREFIX_ERROR, LOG_SUFFIX_PHASE1_2,
-    CLAUDE_MODEL, CLAUDE_MAX_TOKENS
+    CLAUDE_MODEL, CLAUDE_MAX_TOKENS, API_ATTEMPT_TIMEOUT, API_CONNECT_TIMEOUT
 )
 from logger_utils import DualLogger
+from json_utils import json_loads
 from project_utils import (
     read_project_info, get_output_dir, ensure_output_dir,
     read_file_safely, write_file_safely
 )
-from api_retry_utils import call_api_with_retry
+from api_retry_utils import call_api_with_retry, make_idempotency_key, IDEMPOTENCY_HEADER
 from cost_tracker import CostTracker
 
 # グローバル変数（中断ハンドラ用）
@@ -92,7 +95,6 @@ def download_prompts_from_drive(project_name, output_file_path, logger):
     """
     try:
         from googleapiclient.http import MediaIoBaseDownload
-        from googleapiclient.discovery import build
         from google.oauth2.credentials import Credentials
         import io
         
@@ -101,13 +103,11 @@ def download_prompts_from_drive(project_name, output_file_path, logger):
             return False
         
         # 認証
-        from gdrive_checkpoint import authenticate_gdrive, find_project_folder_on_drive
-        creds = authenticate_gdrive()
-        if not creds:
+        from gdrive_checkpoint import find_project_folder_on_drive, get_drive_service
+        service = get_drive_service()
+        if not service:
             return False
         
-        service = build('drive', 'v3', credentials=creds)
-        
         # プロジェクトフォルダを検索
         project_folder_id = find_project_folder_on_drive(service, project_name, parent_folder_id)
         
@@ -161,11 +161,9 @@ def check_existing_prompts(output_file, logger):
         return 0
     
     try:
+        # 有効な行数を1行ずつ読みながらカウント（ファイル全体を行リストにしない）
         with open(output_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
-        # 有効な行数をカウント
-        count = len([line for line in lines if line.strip()])
+            count = sum(1 for line in f if line.strip())
         
         if count > 0:
             logger.log(f"✅ ローカルで {count} 個の既存プロンプトを検出しました。")
@@ -192,15 +190,15 @@ def restore_previous_summaries(output_file, logger):
         if not os.path.exists(output_file):
             return []
         
+        # 最後の3行を取得（読み進めながら直近3行だけを保持）
         with open(output_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+            last_lines = deque(f, maxlen=3)
         
-        # 最後の3行を取得
-        recent_lines = [line.strip() for line in lines[-3:] if line.strip()]
+        recent_lines = [line.strip() for line in last_lines if line.strip()]
         
         summaries = []
         for line in recent_lines:
-            data = json.loads(line)
+            data = json_loads(line)
             if 'visual_summary' in data:
                 summaries.append(data['visual_summary'])
         
@@ -225,20 +223,17 @@ def upload_prompts_to_drive(prompts_file_path, project_name, logger):
     """
     try:
         from googleapiclient.http import MediaFileUpload
-        from googleapiclient.discovery import build
         
         parent_folder_id = os.getenv("GDRIVE_PARENT_FOLDER_ID")
         if not parent_folder_id:
             return
         
         # 認証
-        from gdrive_checkpoint import authenticate_gdrive, find_project_folder_on_drive
-        creds = authenticate_gdrive()
-        if not creds:
+        from gdrive_checkpoint import find_project_folder_on_drive, get_drive_service
+        service = get_drive_service()
+        if not service:
             return
         
-        service = build('drive', 'v3', credentials=creds)
-        
         # プロジェクトフォルダを検索
         project_folder_id = find_project_folder_on_drive(service, project_name, parent_folder_id)
         
@@ -554,11 +549,13 @@ Output TWO separate prompts in XML format:
                 model=CLAUDE_MODEL,
                 max_tokens=CLAUDE_MAX_TOKENS * 2,  # フィナーレは2倍
                 system=system_prompt,
-                messages=[{"role": "user", "content": finale_prompt}]
+                messages=[{"role": "user", "content": finale_prompt}],
+                extra_headers={IDEMPOTENCY_HEADER: make_idempotency_key(_project_name, "phase1_2_finale")}
             ),
             max_retries=3,
             logger=logger,
-            operation_name="感動シーン生成"
+            operation_name="感動シーン生成",
+            provider="claude"
         )
         
         # トークン記録
@@ -579,9 +576,7 @@ Output TWO separate prompts in XML format:
         
         # 既存のindex番号を取得
         with open(output_file, 'r', encoding='utf-8') as f:
-            existing_lines = f.readlines()
-        
-        last_index = len([line for line in existing_lines if line.strip()])
+            last_index = sum(1 for line in f if line.strip())
         
         # 各シーンを保存
         with open(output_file, 'a', encoding='utf-8') as f:
@@ -672,11 +667,13 @@ def generate_prompts_and_save_incrementally(
                                 model=CLAUDE_MODEL,
                                 max_tokens=CLAUDE_MAX_TOKENS,
                                 system=system_prompt,
-                                messages=[{"role": "user", "content": user_prompt}]
+                                messages=[{"role": "user", "content": user_prompt}],
+                                extra_headers={IDEMPOTENCY_HEADER: make_idempotency_key(_project_name, "phase1_2", line_number, parse_retry)}
                             ),
                             max_retries=3,
                             logger=logger,
-                            operation_name=f"プロンプト生成 (行{line_number})"
+                            operation_name=f"プロンプト生成 (行{line_number})",
+                            provider="claude"
                         )
                         
                         if not response or not response.content:
@@ -857,6 +854,7 @@ def main():
         # 🔥 キャッシュヘッダーを追加（最重要）
         client = anthropic.Anthropic(
             api_key=api_key,
+            timeout=httpx.Timeout(API_ATTEMPT_TIMEOUT, connect=API_CONNECT_TIMEOUT),
             default_headers={"anthropic-beta": "prompt-caching-2024-07-31"}
         )
         
@@ -7,27 +7,33 @@ Phase 1.1: キャラクター設定生成スクリプト
 import os
 import sys
 import shutil
+import time
 import traceback
 import anthropic
+import httpx
 from dotenv import load_dotenv
 
 # 共通モジュールのインポート
 from config import (
     BASE_DIR, LOGS_DIR, LOG_PREFIX_ERROR, LOG_SUFFIX_PHASE1_1,
-    CLAUDE_MODEL, CLAUDE_MAX_TOKENS
+    CLAUDE_MODEL, CLAUDE_MAX_TOKENS, API_ATTEMPT_TIMEOUT, API_CONNECT_TIMEOUT,
+    Phase, PHASE_TIMEOUTS
 )
 from logger_utils import DualLogger
 from project_utils import (
     read_project_info, get_output_dir, ensure_output_dir,
     read_file_safely, write_file_safely
 )
-from api_retry_utils import call_api_with_retry
+from api_retry_utils import call_api_with_retry, make_idempotency_key, IDEMPOTENCY_HEADER
 from cost_tracker import CostTracker  # 🆕 コストトラッカー追加
-from gdrive_checkpoint import authenticate_gdrive, find_project_folder_on_drive  # 🆕 Drive チェックポイント
+from gdrive_checkpoint import find_project_folder_on_drive, get_drive_service  # 🆕 Drive チェックポイント
 
 # .envファイルから環境変数を読み込む
 load_dotenv()
 
+# main_pipeline がこのフェーズを打ち切る時刻（それを越えるリトライは行わない）
+_phase_deadline = time.monotonic() + PHASE_TIMEOUTS[Phase.P1_1]
+
 
 def download_character_settings_from_drive(project_name, output_file_path, logger):
     """
@@ -43,7 +49,6 @@ def download_character_settings_from_drive(project_name, output_file_path, logge
     """
     try:
         from googleapiclient.http import MediaIoBaseDownload
-        from googleapiclient.discovery import build
         import io
         
         parent_folder_id = os.getenv("GDRIVE_PARENT_FOLDER_ID")
@@ -51,12 +56,10 @@ def download_character_settings_from_drive(project_name, output_file_path, logge
             return False
         
         # 認証
-        creds = authenticate_gdrive()
-        if not creds:
+        service = get_drive_service()
+        if not service:
             return False
         
-        service = build('drive', 'v3', credentials=creds)
-        
         # プロジェクトフォルダを検索
         project_folder_id = find_project_folder_on_drive(service, project_name, parent_folder_id)
         
@@ -107,13 +110,10 @@ def check_drive_for_character_settings(project_name, logger):
             return False
         
         # 認証
-        creds = authenticate_gdrive()
-        if not creds:
+        service = get_drive_service()
+        if not service:
             return False
         
-        from googleapiclient.discovery import build
-        service = build('drive', 'v3', credentials=creds)
-        
         # プロジェクトフォルダを検索
         project_folder_id = find_project_folder_on_drive(service, project_name, parent_folder_id)
         
@@ -148,19 +148,16 @@ def upload_character_settings_to_drive(settings_file_path, project_name, logger)
     """
     try:
         from googleapiclient.http import MediaFileUpload
-        from googleapiclient.discovery import build
         
         parent_folder_id = os.getenv("GDRIVE_PARENT_FOLDER_ID")
         if not parent_folder_id:
             return
         
         # 認証
-        creds = authenticate_gdrive()
-        if not creds:
+        service = get_drive_service()
+        if not service:
             return
         
-        service = build('drive', 'v3', credentials=creds)
-        
         # プロジェクトフォルダを検索
         project_folder_id = find_project_folder_on_drive(service, project_name, parent_folder_id)
         
@@ -236,11 +233,14 @@ def generate_character_settings(client, script, character_rules, logger):
                 messages=[{
                     "role": "user", 
                     "content": f"<script>\n{script}\n</script>\n\n<base_rules>\n{character_rules}\n</base_rules>"
-                }]
+                }],
+                extra_headers={IDEMPOTENCY_HEADER: make_idempotency_key("phase1_1", script)}
             ),
             max_retries=3,
             logger=logger,
-            operation_name="キャラクター設定の生成"
+            operation_name="キャラクター設定の生成",
+            provider="claude",
+            deadline=_phase_deadline
         )
         
         if not response or not response.content:
@@ -318,7 +318,10 @@ def main():
             logger.save_on_error()
             sys.exit(1)
         
-        client = anthropic.Anthropic(api_key=api_key)
+        client = anthropic.Anthropic(
+            api_key=api_key,
+            timeout=httpx.Timeout(API_ATTEMPT_TIMEOUT, connect=API_CONNECT_TIMEOUT)
+        )
     
     except Exception as e:
         logger.log(f"🚨 Anthropicクライアントの初期化に失敗: {e}")
@@ -46,6 +46,10 @@ HEADERS = {
     "Content-Type": "application/json",
 }
 
+# HTTP セッション（送信・ポーリング・ダウンロードで接続を使い回す）
+# ダウンロードURLは別ホストのため、認証ヘッダーはセッションに持たせず呼び出しごとに付ける
+_http_session = requests.Session()
+
 
 def image_to_base64_url(image_path):
     """画像ファイルをBase64データURLに変換"""
@@ -75,7 +79,7 @@ def submit_video_task(prompt, image_path, logger):
     }
 
     try:
-        resp = requests.post(
+        resp = _http_session.post(
             f"{MINIMAX_BASE_URL}/video_generation",
             headers=HEADERS,
             json=payload,
@@ -111,7 +115,7 @@ def poll_task_status(task_id, logger):
         time.sleep(HAILUO_POLL_INTERVAL)
 
         try:
-            resp = requests.get(
+            resp = _http_session.get(
                 f"{MINIMAX_BASE_URL}/query/video_generation",
                 headers=HEADERS,
                 params={"task_id": task_id},
@@ -152,7 +156,7 @@ def download_video(file_id, output_path, logger):
     Returns: True/False
     """
     try:
-        resp = requests.get(
+        resp = _http_session.get(
             f"{MINIMAX_BASE_URL}/files/retrieve",
             headers=HEADERS,
             params={"file_id": file_id},
@@ -167,7 +171,7 @@ def download_video(file_id, output_path, logger):
             return False
 
         # 動画ファイルをダウンロード
-        video_resp = requests.get(download_url, timeout=120)
+        video_resp = _http_session.get(download_url, timeout=120)
         video_resp.raise_for_status()
 
         with open(output_path, "wb") as f:
@@ -207,19 +211,16 @@ def upload_video_to_drive(video_path, project_name, logger):
     """
     try:
         from googleapiclient.http import MediaFileUpload
-        from googleapiclient.discovery import build
-        from gdrive_checkpoint import authenticate_gdrive, find_project_folder_on_drive
+        from gdrive_checkpoint import find_project_folder_on_drive, get_drive_service
         
         parent_folder_id = os.environ.get("GDRIVE_PARENT_FOLDER_ID")
         if not parent_folder_id:
             return
         
-        creds = authenticate_gdrive()
-        if not creds:
+        service = get_drive_service()
+        if not service:
             return
         
-        service = build('drive', 'v3', credentials=creds)
-        
         # プロジェクトフォルダを検索
         project_folder_id = find_project_folder_on_drive(service, project_name, parent_folder_id)
         
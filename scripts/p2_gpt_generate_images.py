@@ -11,24 +11,40 @@ prompts_data.jsonl から image_prompt を読み込み、GPT Image 1 mini で画
 """
 import os
 import sys
-import json
-import time
 import traceback
 import base64
-import glob
+import re
 import signal
-from openai import OpenAI, BadRequestError, RateLimitError, APIConnectionError
+import threading
+import asyncio
+import httpx
+from openai import AsyncOpenAI, BadRequestError, RateLimitError, APIConnectionError
+
+# pybase64 をインポート（存在する場合のみ。SIMD 実装で base64 デコードが高速）
+try:
+    import pybase64
+    PYBASE64_AVAILABLE = True
+except ImportError:
+    PYBASE64_AVAILABLE = False
+
+# 書き込み前にファイルサイズ分のディスク領域を確保できるか（Linux など POSIX のみ）
+FALLOCATE_AVAILABLE = hasattr(os, "posix_fallocate")
 from dotenv import load_dotenv
-from api_retry_utils import call_api_with_retry
+from api_retry_utils import call_api_with_retry_async, make_idempotency_key, IDEMPOTENCY_HEADER
 from cost_tracker import CostTracker
-from gdrive_checkpoint import check_drive_checkpoint, authenticate_gdrive, find_project_folder_on_drive
+from gdrive_checkpoint import (
+    check_drive_checkpoint, download_files_from_drive, find_project_folder_on_drive,
+    find_images_folder_on_drive, get_drive_service, list_files_in_drive_folder, remember_folder_on_drive
+)
 
 # 共通モジュールのインポート
 from config import (
     LOGS_DIR, LOG_PREFIX_ERROR, LOG_SUFFIX_PHASE2,
-    GPT_IMAGE_MODEL, IMAGE_SIZE, IMAGE_QUALITY, TEST_MODE_LIMIT
+    GPT_IMAGE_MODEL, IMAGE_SIZE, IMAGE_QUALITY, TEST_MODE_LIMIT, MAX_WORKERS,
+    API_ATTEMPT_TIMEOUT, API_CONNECT_TIMEOUT
 )
 from logger_utils import DualLogger
+from json_utils import json_loads
 from project_utils import (
     read_project_info, get_output_dir, ensure_image_output_dir
 )
@@ -39,9 +55,32 @@ _tracker = None
 _project_name = None
 _success_count = 0
 _total_count = 0
+# 並列アップロードで同じフォルダを重複作成しないよう、フォルダの検索・作成は1スレッドずつ行う
+_drive_folder_lock = threading.Lock()
 # .envファイルから環境変数を読み込む
 load_dotenv()
 
+def decode_image_b64(b64_data):
+    """base64 の画像データをデコード（pybase64 があれば使用）"""
+    if PYBASE64_AVAILABLE:
+        return pybase64.b64decode(b64_data, validate=False)
+    return base64.b64decode(b64_data)
+
+def save_image_file(filepath, image_data):
+    """
+    画像データをファイルに保存
+    
+    POSIX 環境では先に posix_fallocate で全体の領域を確保してから1回で書き込む
+    """
+    fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    with open(fd, "wb") as f:
+        if FALLOCATE_AVAILABLE and image_data:
+            try:
+                os.posix_fallocate(fd, 0, len(image_data))
+            except OSError:
+                pass  # 未対応のファイルシステムでは確保せずに書き込む
+        f.write(image_data)
+
 def handle_interrupt(signum, frame):
     """中断シグナルをキャッチ"""
     global _logger, _tracker, _project_name, _success_count, _total_count
@@ -63,6 +102,9 @@ MODEL_PRICES = {
     "gpt-image-1-mini": 0.052 # Mini版
 }
 
+# 修正版プロンプトで再試行するモデレーションエラーのキーワード（呼び出しごとにリストを作らない）
+MODERATION_ERROR_PATTERN = re.compile(r"content_policy|safety|moderation|unsafe", re.IGNORECASE)
+
 
 def select_model_for_image(index, total_count):
     """
@@ -96,20 +138,16 @@ def download_prompts_from_drive(project_name, output_file_path, logger):
     """
     try:
         from googleapiclient.http import MediaIoBaseDownload
-        from googleapiclient.discovery import build
-        import io
         
         parent_folder_id = os.getenv("GDRIVE_PARENT_FOLDER_ID")
         if not parent_folder_id:
             return False
         
         # 認証
-        creds = authenticate_gdrive()
-        if not creds:
+        service = get_drive_service()
+        if not service:
             return False
         
-        service = build('drive', 'v3', credentials=creds)
-        
         # プロジェクトフォルダを検索
         project_folder_id = find_project_folder_on_drive(service, project_name, parent_folder_id)
         
@@ -128,17 +166,16 @@ def download_prompts_from_drive(project_name, output_file_path, logger):
         # ファイルをダウンロード
         file_id = files[0]['id']
         request = service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
         
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        
-        # ローカルに保存
+        # チャンクごとに一時ファイルへ直接書き出し、完了後に置き換える（全体をメモリに載せない）
         os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
-        with open(output_file_path, 'wb') as f:
-            f.write(fh.getvalue())
+        tmp_path = f"{output_file_path}.tmp"
+        with open(tmp_path, 'wb') as fh:
+            downloader = MediaIoBaseDownload(fh, request)
+            done = False
+            while not done:
+                status, done = downloader.next_chunk()
+        os.replace(tmp_path, output_file_path)
         
         logger.log(f"☁️  Drive から prompts_data.jsonl をダウンロードしました")
         return True
@@ -167,14 +204,14 @@ def load_prompts_from_jsonl(prompts_file_path, logger):
     
     try:
         prompts = []
-        with open(prompts_file_path, "r", encoding="utf-8") as f:
+        with open(prompts_file_path, "rb") as f:
             for line_num, line in enumerate(f, 1):
                 line = line.strip()
                 if not line:
                     continue
                 
                 try:
-                    data = json.loads(line)
+                    data = json_loads(line)
                     
                     # 必須フィールドの確認
                     if "index" not in data or "image_prompt" not in data:
@@ -183,7 +220,7 @@ def load_prompts_from_jsonl(prompts_file_path, logger):
                     
                     prompts.append(data)
                 
-                except json.JSONDecodeError as e:
+                except ValueError as e:
                     logger.log(f"⚠️ 行{line_num}: JSON解析エラー: {e}")
                     continue
         
@@ -218,8 +255,8 @@ def check_existing_images(image_output_dir, project_name, logger):
     # まずローカルを確認
     if os.path.exists(image_output_dir):
         try:
-            local_images = glob.glob(os.path.join(image_output_dir, "*.png"))
-            existing_images = set([os.path.basename(f) for f in local_images])
+            with os.scandir(image_output_dir) as entries:
+                existing_images = {entry.name for entry in entries if entry.name.endswith(".png")}
             
             if existing_images:
                 logger.log(f"")
@@ -286,79 +323,28 @@ def download_images_from_drive(project_name, parent_folder_id, local_images_dir,
         int: ダウンロードした画像数
     """
     try:
-        from googleapiclient.http import MediaIoBaseDownload
-        from googleapiclient.discovery import build
-        import io
-        
-        creds = authenticate_gdrive()
-        if not creds:
+        service = get_drive_service()
+        if not service:
             return 0
         
-        service = build('drive', 'v3', credentials=creds)
-        
         # プロジェクトフォルダを検索
         project_folder_id = find_project_folder_on_drive(service, project_name, parent_folder_id)
         if not project_folder_id:
             return 0
         
         # images フォルダを検索
-        query = f"name='images' and '{project_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
-        results = service.files().list(q=query, spaces='drive', fields='files(id)').execute()
-        folders = results.get('files', [])
-        
-        if not folders:
+        images_folder_id = find_images_folder_on_drive(service, project_folder_id)
+        if not images_folder_id:
             return 0
         
-        images_folder_id = folders[0]['id']
-        
         # 出力ディレクトリを作成
         os.makedirs(local_images_dir, exist_ok=True)
         
         # 画像ファイルを一括取得（IDとファイル名のマッピング）
-        query = f"'{images_folder_id}' in parents and trashed=false"
-        results = service.files().list(
-            q=query, spaces='drive',
-            fields='files(id, name)',
-            pageSize=1000
-        ).execute()
-        drive_files = {f['name']: f['id'] for f in results.get('files', [])}
-        
-        downloaded = 0
-        for name in image_names:
-            local_path = os.path.join(local_images_dir, name)
-            
-            # 既にローカルにある場合はスキップ
-            if os.path.exists(local_path):
-                downloaded += 1
-                continue
-            
-            file_id = drive_files.get(name)
-            if not file_id:
-                continue
-            
-            try:
-                request = service.files().get_media(fileId=file_id)
-                fh = io.BytesIO()
-                downloader = MediaIoBaseDownload(fh, request)
-                
-                done = False
-                while not done:
-                    status, done = downloader.next_chunk()
-                
-                with open(local_path, 'wb') as f:
-                    f.write(fh.getvalue())
-                
-                downloaded += 1
-                
-                # 進捗表示（20枚ごと）
-                if downloaded % 20 == 0:
-                    logger.log(f"  📥 {downloaded}/{len(image_names)} 枚ダウンロード済み")
-            
-            except Exception as e:
-                logger.log(f"  ⚠️ {name} のダウンロードに失敗: {e}")
-                continue
+        drive_files = {f['name']: f['id'] for f in list_files_in_drive_folder(service, images_folder_id)}
         
-        return downloaded
+        file_list = [(drive_files[name], name) for name in image_names if name in drive_files]
+        return download_files_from_drive(file_list, local_images_dir, logger.log, len(image_names))
     
     except Exception as e:
         logger.log(f"⚠️ Drive からの画像ダウンロードエラー: {e}")
@@ -376,48 +362,44 @@ def upload_image_to_drive(image_path, project_name, logger):
     """
     try:
         from googleapiclient.http import MediaFileUpload
-        from googleapiclient.discovery import build
         
         parent_folder_id = os.getenv("GDRIVE_PARENT_FOLDER_ID")
         if not parent_folder_id:
             return
         
-        # 認証
-        creds = authenticate_gdrive()
-        if not creds:
+        # 認証（初回のみ。以降はサービスを使い回す）
+        service = get_drive_service()
+        if not service:
             return
         
-        service = build('drive', 'v3', credentials=creds)
-        
-        # プロジェクトフォルダを検索
-        project_folder_id = find_project_folder_on_drive(service, project_name, parent_folder_id)
-        
-        if not project_folder_id:
-            # フォルダがない場合は作成
-            folder_metadata = {
-                'name': project_name,
-                'mimeType': 'application/vnd.google-apps.folder',
-                'parents': [parent_folder_id]
-            }
-            folder = service.files().create(body=folder_metadata, fields='id').execute()
-            project_folder_id = folder.get('id')
-        
-        # images フォルダを検索または作成
-        query = f"name='images' and '{project_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
-        results = service.files().list(q=query, spaces='drive', fields='files(id)').execute()
-        files = results.get('files', [])
-        
-        if files:
-            images_folder_id = files[0]['id']
-        else:
-            # images フォルダを作成
-            folder_metadata = {
-                'name': 'images',
-                'mimeType': 'application/vnd.google-apps.folder',
-                'parents': [project_folder_id]
-            }
-            folder = service.files().create(body=folder_metadata, fields='id').execute()
-            images_folder_id = folder.get('id')
+        with _drive_folder_lock:
+            # プロジェクトフォルダを検索
+            project_folder_id = find_project_folder_on_drive(service, project_name, parent_folder_id)
+            
+            if not project_folder_id:
+                # フォルダがない場合は作成
+                folder_metadata = {
+                    'name': project_name,
+                    'mimeType': 'application/vnd.google-apps.folder',
+                    'parents': [parent_folder_id]
+                }
+                folder = service.files().create(body=folder_metadata, fields='id').execute()
+                project_folder_id = folder.get('id')
+                remember_folder_on_drive(project_name, parent_folder_id, project_folder_id)
+            
+            # images フォルダを検索または作成
+            images_folder_id = find_images_folder_on_drive(service, project_folder_id)
+            
+            if not images_folder_id:
+                # images フォルダを作成
+                folder_metadata = {
+                    'name': 'images',
+                    'mimeType': 'application/vnd.google-apps.folder',
+                    'parents': [project_folder_id]
+                }
+                folder = service.files().create(body=folder_metadata, fields='id').execute()
+                images_folder_id = folder.get('id')
+                remember_folder_on_drive('images', project_folder_id, images_folder_id)
         
         # 画像ファイルをアップロード（既存チェック）
         filename = os.path.basename(image_path)
@@ -466,12 +448,14 @@ def sanitize_prompt_for_moderation(prompt):
     return sanitized
 
 
-def generate_and_save_image(client, prompt, index, image_output_dir, project_name, logger, total_count=0):
+async def generate_and_save_image(client, prompt, index, image_output_dir, project_name, logger, total_count=0):
     """
     1枚の画像を生成してローカルとDriveに保存
     
+    デコード・保存・Drive アップロードはスレッドで実行し、他の画像の生成を止めない
+    
     Args:
-        client: OpenAI クライアント
+        client: AsyncOpenAI クライアント
         prompt: 画像生成プロンプト
         index: 画像番号
         image_output_dir: 出力ディレクトリ
@@ -489,17 +473,19 @@ def generate_and_save_image(client, prompt, index, image_output_dir, project_nam
     
     # まずオリジナルプロンプトで試す
     try:
-        res = call_api_with_retry(
+        res = await call_api_with_retry_async(
             lambda: client.images.generate(
                 model=model,  # 🆕 選択されたモデルを使用
                 prompt=prompt,
                 size=IMAGE_SIZE,
                 quality=IMAGE_QUALITY,
-                extra_body={"moderation": "low"}
+                extra_body={"moderation": "low"},
+                extra_headers={IDEMPOTENCY_HEADER: make_idempotency_key(project_name, "phase2", index)}
             ),
             max_retries=3,
             logger=logger,
-            operation_name=f"画像{index}の生成"
+            operation_name=f"画像{index}の生成",
+            provider="openai"
         )
         
         b64_data = res.data[0].b64_json
@@ -507,19 +493,18 @@ def generate_and_save_image(client, prompt, index, image_output_dir, project_nam
             logger.log(f"⚠️ エラー: APIから画像データ(b64_json)が返されませんでした (画像 {index})。")
             return False
 
-        image_data = base64.b64decode(b64_data)
+        image_data = await asyncio.to_thread(decode_image_b64, b64_data)
         
         filename = f"{index:03d}.png"
         filepath = os.path.join(image_output_dir, filename)
         
         # ローカルに保存
-        with open(filepath, "wb") as f:
-            f.write(image_data)
+        await asyncio.to_thread(save_image_file, filepath, image_data)
         
         logger.log(f"✅ 画像 {index} を保存しました: {filepath}")
         
         # 即座に Drive にも保存
-        upload_image_to_drive(filepath, project_name, logger)
+        await asyncio.to_thread(upload_image_to_drive, filepath, project_name, logger)
         
         return True
 
@@ -529,9 +514,8 @@ def generate_and_save_image(client, prompt, index, image_output_dir, project_nam
         
         # 1. 例外の型で判定
         if isinstance(e, BadRequestError):
-            error_message = str(e).lower()
             # 2. エラーメッセージの内容で二重チェック
-            if any(keyword in error_message for keyword in ["content_policy", "safety", "moderation", "unsafe"]):
+            if MODERATION_ERROR_PATTERN.search(str(e)):
                 is_moderation_error = True
         
         # モデレーションエラーの場合のみ、修正版で1回だけリトライ
@@ -543,17 +527,19 @@ def generate_and_save_image(client, prompt, index, image_output_dir, project_nam
                 # 修正版プロンプトで再試行
                 sanitized_prompt = sanitize_prompt_for_moderation(prompt)
                 
-                res = call_api_with_retry(
+                res = await call_api_with_retry_async(
                     lambda: client.images.generate(
                         model=GPT_IMAGE_MODEL,
                         prompt=sanitized_prompt,
                         size=IMAGE_SIZE,
                         quality=IMAGE_QUALITY,
-                        extra_body={"moderation": "low"}
+                        extra_body={"moderation": "low"},
+                        extra_headers={IDEMPOTENCY_HEADER: make_idempotency_key(project_name, "phase2_sanitized", index)}
                     ),
                     max_retries=3,
                     logger=logger,
-                    operation_name=f"画像{index}の生成 (修正版)"
+                    operation_name=f"画像{index}の生成 (修正版)",
+                    provider="openai"
                 )
                 
                 b64_data = res.data[0].b64_json
@@ -561,18 +547,17 @@ def generate_and_save_image(client, prompt, index, image_output_dir, project_nam
                     logger.log(f"⚠️ 修正版でもデータが返されませんでした (画像 {index})。")
                     return False
 
-                image_data = base64.b64decode(b64_data)
+                image_data = await asyncio.to_thread(decode_image_b64, b64_data)
                 
                 filename = f"{index:03d}.png"
                 filepath = os.path.join(image_output_dir, filename)
                 
-                with open(filepath, "wb") as f:
-                    f.write(image_data)
+                await asyncio.to_thread(save_image_file, filepath, image_data)
                 
                 logger.log(f"✅ 画像 {index} を保存しました (修正版プロンプトで成功): {filepath}")
                 
                 # 即座に Drive にも保存
-                upload_image_to_drive(filepath, project_name, logger)
+                await asyncio.to_thread(upload_image_to_drive, filepath, project_name, logger)
                 
                 return True
                 
@@ -587,6 +572,58 @@ def generate_and_save_image(client, prompt, index, image_output_dir, project_nam
         return False
 
 
+async def generate_pending_images(client, prompts_to_process, existing_images, image_output_dir, project_name, logger, total_count):
+    """
+    未生成の画像を並列に生成（同時実行数は MAX_WORKERS まで）
+    
+    Args:
+        client: AsyncOpenAI クライアント（完了後にクローズする）
+        prompts_to_process: 処理対象のプロンプトデータ
+        existing_images: 生成済みの画像ファイル名
+        total_count: 総画像数（モデル選択・進捗表示用）
+    
+    Returns:
+        tuple: (合計成功数（既存分を含む）, 失敗数)
+    """
+    semaphore = asyncio.Semaphore(MAX_WORKERS)
+    success_count = len(existing_images)  # 既に完了済みの分も含む
+    failed_count = 0
+    
+    async def generate_one(image_index, image_prompt):
+        global _success_count
+        nonlocal success_count, failed_count
+        
+        async with semaphore:
+            succeeded = await generate_and_save_image(client, image_prompt, image_index, image_output_dir, project_name, logger, total_count=total_count)
+        
+        if succeeded:
+            success_count += 1
+            _success_count = success_count
+            
+            # 10枚ごとにログ出力
+            if success_count % 10 == 0:
+                logger.log(f"\n📊 進捗: {success_count}/{total_count} 枚完了\n")
+        else:
+            failed_count += 1
+    
+    tasks = []
+    for prompt_data in prompts_to_process:
+        image_index = prompt_data["index"]
+        filename = f"{image_index:03d}.png"
+        
+        # 既に存在する場合はスキップ
+        if filename in existing_images:
+            logger.log(f"⏭️  画像 {image_index} は既に生成済み（スキップ）")
+            continue
+        
+        tasks.append(generate_one(image_index, prompt_data["image_prompt"]))
+    
+    async with client:
+        await asyncio.gather(*tasks)
+    
+    return success_count, failed_count
+
+
 def main():
     """メインの処理フロー"""
     project_name, model_name, _ = read_project_info()
@@ -615,7 +652,14 @@ def main():
             logger.log("🚨 エラー: 環境変数 'OPENAI_API_KEY' が設定されていません。")
             logger.save_on_error()
             sys.exit(1)
-        client = OpenAI(api_key=api_key)
+        # 並列リクエストで接続を使い回せるよう、同時実行数に合わせたコネクションプールを持たせる
+        client = AsyncOpenAI(
+            api_key=api_key,
+            timeout=httpx.Timeout(API_ATTEMPT_TIMEOUT, connect=API_CONNECT_TIMEOUT),
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=MAX_WORKERS * 2, max_keepalive_connections=MAX_WORKERS)
+            )
+        )
     except Exception as e:
         logger.log(f"🚨 OpenAIクライアントの初期化に失敗: {e}")
         logger.save_on_error()
@@ -664,31 +708,11 @@ def main():
                 prompts_to_process = prompt_data_list[:TEST_MODE_LIMIT]
 
             # 未完了分のみ処理
-            failed_count = 0
-            success_count = len(existing_images)  # 既に完了済みの分も含む
             _total_count = len(prompt_data_list)  # 追加
-            
-            for prompt_data in prompts_to_process:
-                image_index = prompt_data["index"]
-                image_prompt = prompt_data["image_prompt"]
-                filename = f"{image_index:03d}.png"
-                
-                # 既に存在する場合はスキップ
-                if filename in existing_images:
-                    logger.log(f"⏭️  画像 {image_index} は既に生成済み（スキップ）")
-                    continue
-                
-                if generate_and_save_image(client, image_prompt, image_index, image_output_dir, project_name, logger, total_count=len(prompt_data_list)):
-                    success_count += 1
-                    _success_count = success_count
-                    
-                    # 10枚ごとにログ出力
-                    if success_count % 10 == 0:
-                        logger.log(f"\n📊 進捗: {success_count}/{len(prompt_data_list)} 枚完了\n")
-                else:
-                    failed_count += 1
-                
-                time.sleep(1)
+            success_count, failed_count = asyncio.run(generate_pending_images(
+                client, prompts_to_process, existing_images, image_output_dir,
+                project_name, logger, total_count=len(prompt_data_list)
+            ))
             
             # 🆕 モデル別のコスト計算
             high_quality_count = 0
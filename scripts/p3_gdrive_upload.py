@@ -30,6 +30,9 @@ from project_utils import read_project_info, get_output_dir
 # .envファイルから環境変数を読み込む
 load_dotenv()
 
+# BatchHttpRequest 1回あたりの最大リクエスト数（Drive API の上限）
+DRIVE_BATCH_LIMIT = 100
+
 
 def load_cost_data(project_name, output_dir, logger):
     """
@@ -260,6 +263,48 @@ def authenticate_gdrive(logger):
     return creds
 
 
+def find_existing_files_batch(service, folder_id, filenames):
+    """
+    フォルダ内の既存ファイルを BatchHttpRequest でまとめて検索
+    （最大 DRIVE_BATCH_LIMIT 件の検索を1回の HTTP リクエストで送る）
+    
+    Args:
+        service: Google Drive API サービス
+        folder_id: 検索対象のフォルダID
+        filenames: ファイル名のリスト
+    
+    Returns:
+        dict: {ファイル名: ファイルID}（存在するもののみ）
+    """
+    existing = {}
+    failed = []
+    
+    def callback(request_id, response, exception):
+        if exception is not None:
+            failed.append(request_id)
+            return
+        files = response.get('files', [])
+        if files:
+            existing[request_id] = files[0]['id']
+    
+    for start in range(0, len(filenames), DRIVE_BATCH_LIMIT):
+        batch = service.new_batch_http_request(callback=callback)
+        for filename in filenames[start:start + DRIVE_BATCH_LIMIT]:
+            query = f"name='{filename}' and '{folder_id}' in parents and trashed=false"
+            batch.add(service.files().list(q=query, spaces='drive', fields='files(id)'), request_id=filename)
+        batch.execute()
+    
+    # バッチ内で失敗した検索のみ個別に再試行（重複作成を防ぐ）
+    for filename in failed:
+        query = f"name='{filename}' and '{folder_id}' in parents and trashed=false"
+        results = service.files().list(q=query, spaces='drive', fields='files(id)').execute()
+        files = results.get('files', [])
+        if files:
+            existing[filename] = files[0]['id']
+    
+    return existing
+
+
 def upload_folder_to_drive(service, project_name, local_project_path, parent_folder_id, logger):
     """
     指定されたフォルダをGoogle Driveにアップロードし、共有リンクを返す
@@ -314,24 +359,22 @@ def upload_folder_to_drive(service, project_name, local_project_path, parent_fol
         if f.lower().endswith(('.txt', '.jsonl')) and os.path.isfile(os.path.join(local_project_path, f))
     ]
     
+    # 既存ファイルをまとめて検索
+    existing_text_files = find_existing_files_batch(service, folder_id, text_files)
+    
     for filename in text_files:
         logger.log(f"  - アップロード中: {filename}")
         local_file_path = os.path.join(local_project_path, filename)
         
-        # 既存ファイルを検索
-        query = f"name='{filename}' and '{folder_id}' in parents and trashed=false"
-        results = service.files().list(q=query, spaces='drive', fields='files(id)').execute()
-        existing_files = results.get('files', [])
-        
         # MIMEタイプを決定
         if filename.endswith('.jsonl'):
             mimetype = 'application/json'
         else:
             mimetype = 'text/plain'
         
-        if existing_files:
+        if filename in existing_text_files:
             # 既存ファイルを更新
-            file_id = existing_files[0]['id']
+            file_id = existing_text_files[filename]
             media = MediaFileUpload(local_file_path, mimetype=mimetype)
             service.files().update(fileId=file_id, media_body=media).execute()
             logger.log(f"    ✓ 既存ファイルを更新しました: {filename}")
@@ -371,18 +414,16 @@ def upload_folder_to_drive(service, project_name, local_project_path, parent_fol
             if f.lower().endswith('.png')
         ])
         
+        # 既存ファイルをまとめて検索
+        existing_image_files = find_existing_files_batch(service, image_folder_id, image_files)
+        
         for i, filename in enumerate(image_files):
             logger.log(f"  - 画像アップロード中 ({i+1}/{len(image_files)}): {filename}")
             local_file_path = os.path.join(local_image_path, filename)
             
-            # 既存ファイルを検索
-            query = f"name='{filename}' and '{image_folder_id}' in parents and trashed=false"
-            results = service.files().list(q=query, spaces='drive', fields='files(id)').execute()
-            existing_files = results.get('files', [])
-            
-            if existing_files:
+            if filename in existing_image_files:
                 # 既存ファイルを更新
-                file_id = existing_files[0]['id']
+                file_id = existing_image_files[filename]
                 media = MediaFileUpload(local_file_path, mimetype='image/png')
                 service.files().update(fileId=file_id, media_body=media).execute()
             else:
@@ -420,17 +461,15 @@ def upload_folder_to_drive(service, project_name, local_project_path, parent_fol
             if f.lower().endswith(('.mp4', '.webm'))
         ])
         
+        # 既存ファイルをまとめて検索
+        existing_video_files = find_existing_files_batch(service, video_folder_id, video_files)
+        
         for i, filename in enumerate(video_files):
             logger.log(f"  - 動画アップロード中 ({i+1}/{len(video_files)}): {filename}")
             local_file_path = os.path.join(local_video_path, filename)
             
-            # 既存ファイルを検索
-            query = f"name='{filename}' and '{video_folder_id}' in parents and trashed=false"
-            results = service.files().list(q=query, spaces='drive', fields='files(id)').execute()
-            existing_files = results.get('files', [])
-            
-            if existing_files:
-                file_id = existing_files[0]['id']
+            if filename in existing_video_files:
+                file_id = existing_video_files[filename]
                 media = MediaFileUpload(local_file_path, mimetype='video/mp4')
                 service.files().update(fileId=file_id, media_body=media).execute()
             else:
@@ -466,7 +505,7 @@ def main():
             if not credentials:
                 error_occurred = True
             else:
-                drive_service = build('drive', 'v3', credentials=credentials)
+                drive_service = build('drive', 'v3', credentials=credentials, cache_discovery=False)
                 
                 local_project_folder = get_output_dir(project_name, model_name)
                 